@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+from cookie import routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Reads of views with replica_reads = True go to a read replica,
+    unless the client made a write request in the last
+    REPLICA_PIN_SECONDS, so it always sees its own writes.
+    """
+
+    def process_request(self, request):
+        # Threads serve many requests, do not inherit the previous choice
+        routers.read_from_primary()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method in SAFE_METHODS \
+                and getattr(view_class, 'replica_reads', False) \
+                and settings.REPLICA_PIN_COOKIE not in request.COOKIES:
+            routers.read_from_replica()
+
+    def process_response(self, request, response):
+        routers.read_from_primary()
+        if request.method not in SAFE_METHODS and routers.replica_aliases():
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
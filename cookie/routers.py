@@ -0,0 +1,50 @@
+"""
+Database router sending reads of replica_reads views to read replicas.
+
+Replicas are the databases whose alias starts with 'replica' (see
+DB_REPLICAS in settings). ReplicaRoutingMiddleware picks one replica
+for the whole request, everything else reads from and writes to the
+primary ('default').
+"""
+import contextvars
+import random
+from django.conf import settings
+
+PRIMARY = 'default'
+
+_replica = contextvars.ContextVar('replica', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def read_from_replica():
+    aliases = replica_aliases()
+    _replica.set(random.choice(aliases) if aliases else None)
+
+
+def read_from_primary():
+    _replica.set(None)
+
+
+def reading_from_replica():
+    return _replica.get() is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Primary is returned rather than None, otherwise Django reads
+        # related objects from the database an instance was loaded from,
+        # e.g. a replica for instances cached by a replica_reads view
+        return _replica.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 from django.contrib.messages import constants as messages
 from django.urls import reverse_lazy
 from pathlib import Path
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_cleanup.apps.CleanupConfig',
     'debug_toolbar',
     'crispy_forms',
@@ -64,6 +66,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cookie.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'cookie.urls'
@@ -97,10 +100,133 @@ DATABASES = {
         'USER': env("DB_USER"),
         'PASSWORD': env("DB_PASSWORD"),
         'HOST': env("DB_HOST"),
-        'PORT': env("DB_PORT")
+        'PORT': env("DB_PORT"),
+        # Seconds to keep a connection open between requests, 0 closes it
+        # after every request. Keep 0 under ASGI and use a pooler instead
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+        # Check a reused connection before the first query of a request
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', default=True),
+        # PgBouncer in transaction pooling mode cannot keep
+        # server-side cursors open between transactions
+        'DISABLE_SERVER_SIDE_CURSORS': env.bool('DB_PGBOUNCER', default=False),
+        'OPTIONS': {
+            'connect_timeout': env.int('DB_CONNECT_TIMEOUT', default=5),
+        },
+    }
+}
+
+# Read replicas as host:port, e.g. DB_REPLICAS=10.0.0.2:5432,10.0.0.3:5432
+# Read-only views read from them, see cookie/routers.py
+for number, replica in enumerate(env.list('DB_REPLICAS', default=[]), start=1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['cookie.routers.ReplicaRouter']
+
+# After a write request, a client reads from the primary for this many
+# seconds, so replication lag does not hide its own changes
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=10)
+REPLICA_PIN_COOKIE = 'read_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# CACHE_URL examples: locmemcache://, filecache:///var/tmp/cookie,
+# redis://127.0.0.1:6379/1
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
 }
 
+MOVIES_CACHE_ALIAS = 'default'
+
+# Local memory is kept by each process, so a logout or a changed user
+# would not be seen by other workers
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# With a shared cache, sessions are read from the cache and written
+# through to the database, so they survive a cache restart
+SESSION_ENGINE = env('SESSION_ENGINE', default=(
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE
+    else 'django.contrib.sessions.backends.db'))
+
+# Users resolved from sessions by EmailAuthBackend are cached with
+# a shared cache, see users/authentication.py, 0 turns it off
+USERS_CACHE_ALIAS = 'default'
+
+USERS_CACHE_TIMEOUT = env.int('USERS_CACHE_TIMEOUT',
+                              default=60 * 15 if SHARED_CACHE else 0)
+
+# Login and registration attempts allowed per IP address and per email
+# in any USERS_THROTTLE_WINDOW seconds, 0 turns a limit off
+USERS_THROTTLE_WINDOW = env.int('USERS_THROTTLE_WINDOW', default=60 * 5)
+
+USERS_THROTTLE_LIMITS = {
+    'login': {
+        'ip': env.int('LOGIN_THROTTLE_PER_IP', default=30),
+        'email': env.int('LOGIN_THROTTLE_PER_EMAIL', default=10),
+    },
+    'register': {
+        'ip': env.int('REGISTER_THROTTLE_PER_IP', default=10),
+        'email': env.int('REGISTER_THROTTLE_PER_EMAIL', default=3),
+    },
+}
+
+MOVIES_CACHE_TIMEOUT = env.int('MOVIES_CACHE_TIMEOUT', default=60 * 15)
+
+# Serve read-only movie pages with async views, useful only under ASGI
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+MOVIES_PER_PAGE = 24
+
+REVIEWS_PER_PAGE = 20
+
+REVIEWS_STREAM_CHUNK_SIZE = 500
+
+SEARCH_RESULTS_PER_SECTION = 20
+
+# Dotted paths to classes from movies.search, the in-memory backend
+# works without PostgreSQL, the fallback one is used on database errors
+SEARCH_BACKEND = env(
+    'SEARCH_BACKEND', default='movies.search.postgres.PostgresSearchBackend')
+
+SEARCH_FALLBACK_BACKEND = env('SEARCH_FALLBACK_BACKEND', default='')
+
+SEARCH_MEMORY_INDEX_MAX_AGE = env.int('SEARCH_MEMORY_INDEX_MAX_AGE', default=300)
+
+# Run search sections in a thread pool, each with its own connection,
+# sections slower than the timeout (seconds, counted from the start of
+# a section) are left out of results. Sections still queued when the
+# pool is busy are run by the request thread
+SEARCH_CONCURRENT_SECTIONS = env.bool('SEARCH_CONCURRENT_SECTIONS', default=False)
+
+SEARCH_SECTION_TIMEOUT = env.float('SEARCH_SECTION_TIMEOUT', default=2.0)
+
+SEARCH_THREADS = env.int('SEARCH_THREADS', default=8)
+
+SEARCH_CACHE_TIMEOUT = env.int('SEARCH_CACHE_TIMEOUT', default=60 * 5)
+
+# Searches allowed per client in any SEARCH_RATE_LIMIT_WINDOW seconds,
+# either of them 0 turns the limit off
+SEARCH_RATE_LIMIT = env.int('SEARCH_RATE_LIMIT', default=30)
+
+SEARCH_RATE_LIMIT_WINDOW = env.int('SEARCH_RATE_LIMIT_WINDOW', default=60)
+
+AUTOCOMPLETE_RESULTS = 10
+
+# Rebuild the autocomplete index in a background thread after changes,
+# serving the old one meanwhile
+AUTOCOMPLETE_REBUILD_IN_BACKGROUND = env.bool('AUTOCOMPLETE_REBUILD_IN_BACKGROUND',
+                                              default=True)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -122,6 +248,45 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Password hashing profile, the cost of a login attempt:
+# - pbkdf2: Django's default, PASSWORD_PBKDF2_ITERATIONS
+# - scrypt: PASSWORD_SCRYPT_WORK_FACTOR, a power of 2
+# - argon2: PASSWORD_ARGON2_TIME_COST and PASSWORD_ARGON2_MEMORY_COST (KiB),
+#   needs argon2-cffi
+# - fast: MD5, used by the test suite only
+# Hashes of the other profiles are still accepted and replaced on login.
+# Distribution of hashes in use: python manage.py password_hash_report
+TESTING = sys.argv[1:2] == ['test']
+
+PASSWORD_HASHER = env('PASSWORD_HASHER', default='fast' if TESTING else 'pbkdf2')
+
+PASSWORD_HASHER_PROFILES = {
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+    'fast': 'django.contrib.auth.hashers.MD5PasswordHasher',
+}
+
+# The chosen hasher first, then the others except fast,
+# so MD5 hashes are never accepted outside of tests
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER]] + [
+    hasher for profile, hasher in PASSWORD_HASHER_PROFILES.items()
+    if profile not in (PASSWORD_HASHER, 'fast')
+]
+
+PASSWORD_PBKDF2_ITERATIONS = env.int('PASSWORD_PBKDF2_ITERATIONS', default=600000)
+
+PASSWORD_SCRYPT_WORK_FACTOR = env.int('PASSWORD_SCRYPT_WORK_FACTOR', default=2 ** 14)
+
+PASSWORD_ARGON2_TIME_COST = env.int('PASSWORD_ARGON2_TIME_COST', default=2)
+
+PASSWORD_ARGON2_MEMORY_COST = env.int('PASSWORD_ARGON2_MEMORY_COST', default=102400)
+
+# Outdated hashes are replaced after login in a background thread,
+# instead of hashing the password a second time in the login request
+PASSWORD_REHASH_IN_BACKGROUND = env.bool('PASSWORD_REHASH_IN_BACKGROUND',
+                                         default=True)
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -160,9 +325,10 @@ MESSAGE_TAGS = {
 
 TAGGIT_CASE_INSENSITIVE = True
 
+# A single backend, so a failed login is not retried by another
+# backend with another password hash
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
-    'users.authentication.EmailAuthBackend'
+    'users.authentication.EmailAuthBackend',
 ]
 
 INTERNAL_IPS = [
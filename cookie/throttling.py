@@ -0,0 +1,64 @@
+"""
+Sliding window rate limit, used for searches (movies.throttling) and
+for login and registration attempts (users.throttling).
+
+Counts live in a Django cache, so all processes share them with Redis
+or memcached, and are only changed by atomic add() and incr().
+"""
+import hashlib
+import math
+import time
+
+
+def increment(cache, key, timeout=None):
+    # add() does nothing if the key exists, incr() is atomic in
+    # Redis and memcached, so concurrent requests are all counted
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(key, 1, timeout)
+        return 1
+
+
+class SlidingWindow:
+    """
+    At most limit requests per client in any period of window seconds,
+    a limit or window of 0 turns it off. The count over the last window
+    is estimated from two fixed windows: the current one and the part
+    of the previous one that still falls into the last window.
+    Requests are counted before they are checked, rejected ones
+    included, so concurrent requests cannot all see the same count and
+    a client that keeps hammering stays limited.
+    """
+
+    def __init__(self, cache, prefix, limit, window):
+        self.cache = cache
+        self.prefix = prefix
+        self.limit = limit
+        self.window = window
+
+    def key(self, client, index):
+        # Clients may be emails, long or with characters memcached rejects
+        return self.prefix + hashlib.md5(f'{client}:{index}'.encode()).hexdigest()
+
+    def attempt(self, client):
+        """Count a request, return 0 if it is allowed, otherwise seconds to wait."""
+        if not self.limit or not self.window:
+            return 0
+        now = time.time()
+        index = int(now // self.window)
+        offset = now - index * self.window
+        current = increment(self.cache, self.key(client, index),
+                            math.ceil(2 * self.window))
+        previous = self.cache.get(self.key(client, index - 1), 0)
+        # Part of the previous window that is still inside the last window
+        weight = (self.window - offset) / self.window
+        if current + previous * weight <= self.limit:
+            return 0
+        if current > self.limit:
+            return self.window - offset
+        # Until enough of the previous window has slid out
+        return self.window - offset - \
+            self.window * (self.limit - current) / previous
@@ -3,13 +3,24 @@ from django.contrib import admin
 from django.db.models.query import QuerySet
 from django.http.request import HttpRequest
 from django.utils.html import format_html
-from movies.models import Movie, Director, Actor
+from movies.models import Movie, Director, Actor, SlugHistory
 
 
 class ActorInline(admin.TabularInline):
     model = Movie.actors.through
 
 
+class SlugHistoryInline(admin.TabularInline):
+    # Old slugs redirect to the movie, deleting one makes its URLs 404
+    model = SlugHistory
+    fields = ['slug', 'changed']
+    readonly_fields = ['slug', 'changed']
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Director)
 class DirectorAdmin(admin.ModelAdmin):
     list_display = ['name', 'photo_tag', 'slugged_name']
@@ -47,7 +58,7 @@ class MovieAdmin(admin.ModelAdmin):
     search_fields = ['title', 'slug', 'country']
     readonly_fields = ['poster_tag']
     exclude = ['slug', 'actors']
-    inlines = (ActorInline, )
+    inlines = (ActorInline, SlugHistoryInline)
     autocomplete_fields = ['director']
 
     def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
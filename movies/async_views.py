@@ -0,0 +1,232 @@
+"""
+Async versions of the read-only movie pages, used instead of the ones
+from movies.views when ASYNC_VIEWS is set (see movies/urls.py).
+They build the same context and share cache entries with the sync views.
+Independent queries are awaited together, note that Django's async ORM
+still runs them one by one in a single thread, what is saved is the
+thread each request would otherwise hold while waiting.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponsePermanentRedirect
+from django.shortcuts import render
+from django.urls import reverse
+from django.views.generic import View
+from taggit.models import Tag
+from movies import caching
+from movies.caching import dependency
+from movies.genres import aget_genre_index
+from movies.models import Movie, Director, Actor, Rating
+from movies.pagination import KeysetPaginator
+from movies.search import asearch
+from movies.slugs import aget_current_slug
+from movies.throttling import client_id, search_window
+from movies.views import movie_dependencies, MovieListPageMixin, \
+    MovieDetailView as SyncMovieDetailView
+
+
+async def get_user(request):
+    # request.user is loaded lazily from the session, which must
+    # not happen in the event loop thread (e.g. while rendering)
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def arender(request, template_name, context):
+    await get_user(request)
+    return await sync_to_async(render)(request, template_name, context)
+
+
+class IndexView(View):
+    replica_reads = True
+    template_name = 'movies/index.html'
+
+    async def get(self, request, *args, **kwargs):
+        genres = await aget_genre_index()
+        return await arender(request, self.template_name, {'genres': genres})
+
+
+class AsyncMovieListPageMixin(MovieListPageMixin):
+    async def aget_movies_page(self, movies, cache_key, dependencies):
+        sort = self.request.GET.get('sort')
+        if sort not in self.orderings:
+            sort = 'title'
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        per_page = settings.MOVIES_PER_PAGE
+        paginator = KeysetPaginator(movies.cards(), self.orderings[sort],
+                                    per_page)
+
+        async def build_page():
+            page = await paginator.aget_page(after=after, before=before)
+            return page, dependencies + movie_dependencies(page)
+
+        async def build_count():
+            return await movies.acount(), dependencies
+
+        page, number_of_movies = await asyncio.gather(
+            caching.acached(
+                f'{cache_key}:{sort}:{per_page}:{after}:{before}', build_page),
+            caching.acached(f'{cache_key}:count', build_count)
+        )
+        return {'movies': page, 'page': page, 'sort': sort,
+                'number_of_movies': number_of_movies}
+
+
+class MoviesByGenreListView(AsyncMovieListPageMixin, View):
+    replica_reads = True
+    template_name = 'movies/movies_by_genre.html'
+
+    async def get(self, request, *args, **kwargs):
+        genre_slug = self.kwargs['slug']
+        genre = await caching.acached(f'genre:{genre_slug}',
+                                      lambda: self.build_genre(genre_slug))
+        context = await self.aget_movies_page(
+            Movie.objects.filter(genres=genre),
+            f'genre-movies:{genre.id}',
+            [dependency('genre', genre.id)]
+        )
+        context['genre'] = genre
+        return await arender(request, self.template_name, context)
+
+    async def build_genre(self, genre_slug):
+        genre = await Tag.objects.filter(slug=genre_slug).afirst()
+        if not genre:
+            raise Http404
+        return genre, [dependency('genre', genre.id),
+                       dependency('genre-slug', genre_slug)]
+
+
+class MovieDetailView(View):
+    replica_reads = True
+    queryset = SyncMovieDetailView.queryset
+    template_name = 'movies/movie_detail.html'
+
+    async def get(self, request, *args, **kwargs):
+        slug = self.kwargs['slug']
+        current_slug = await aget_current_slug(slug)
+        if current_slug is None:
+            raise Http404
+        if current_slug != slug:
+            return HttpResponsePermanentRedirect(
+                reverse('movies:movie-detail', kwargs={'slug': current_slug}))
+        user = await get_user(request)
+        movie, rating = await asyncio.gather(
+            caching.acached(f'movie-detail:{slug}',
+                            lambda: self.build_object(slug)),
+            self.get_rating(slug, user)
+        )
+        return await arender(request, self.template_name, {
+            'object': movie,
+            'movie': movie,
+            'rating': rating,
+            'number_of_ratings': movie.number_of_ratings,
+            'cache_timeout': settings.MOVIES_CACHE_TIMEOUT,
+        })
+
+    async def build_object(self, slug):
+        try:
+            # aget() runs get() in a thread, so prefetching works
+            movie = await self.queryset.aget(slug=slug)
+        except Movie.DoesNotExist:
+            raise Http404
+        dependencies = [dependency('movie-slug', slug)]
+        dependencies += movie_dependencies([movie])
+        dependencies += [dependency('actor', actor.id)
+                         for actor in movie.actors.all()]
+        dependencies += [dependency('genre', genre.id)
+                         for genre in movie.genres.all()]
+        movie.cache_version = await sync_to_async(caching.version_token)(
+            dependencies)
+        return movie, dependencies
+
+    async def get_rating(self, slug, user):
+        if not user.is_authenticated:
+            return None
+        return await Rating.objects.filter(movie__slug=slug, owner=user).afirst()
+
+
+class DirectorPageView(AsyncMovieListPageMixin, View):
+    replica_reads = True
+    template_name = 'movies/director_page.html'
+
+    async def get(self, request, *args, **kwargs):
+        director_slugged_name = self.kwargs['slug']
+        director = await caching.acached(
+            f'director:{director_slugged_name}',
+            lambda: self.build_director(director_slugged_name)
+        )
+        context = await self.aget_movies_page(
+            Movie.objects.filter(director=director),
+            f'director-movies:{director.id}',
+            [dependency('director', director.id)]
+        )
+        context['director'] = director
+        return await arender(request, self.template_name, context)
+
+    async def build_director(self, director_slugged_name):
+        director = await Director.objects.filter(
+            slugged_name=director_slugged_name).afirst()
+        if not director:
+            raise Http404
+        return director, [dependency('director', director.id),
+                          dependency('director-slug', director_slugged_name)]
+
+
+class ActorPageView(AsyncMovieListPageMixin, View):
+    replica_reads = True
+    template_name = 'movies/actor_page.html'
+
+    async def get(self, request, *args, **kwargs):
+        actor_slugged_name = self.kwargs['slug']
+        actor = await caching.acached(
+            f'actor:{actor_slugged_name}',
+            lambda: self.build_actor(actor_slugged_name)
+        )
+        context = await self.aget_movies_page(
+            Movie.objects.filter(actors=actor),
+            f'actor-movies:{actor.id}',
+            [dependency('actor', actor.id)]
+        )
+        context['actor'] = actor
+        return await arender(request, self.template_name, context)
+
+    async def build_actor(self, actor_slugged_name):
+        actor = await Actor.objects.filter(
+            slugged_name=actor_slugged_name).afirst()
+        if not actor:
+            raise Http404
+        return actor, [dependency('actor', actor.id),
+                       dependency('actor-slug', actor_slugged_name)]
+
+
+class SearchResultsView(View):
+    replica_reads = True
+    template_name = 'movies/search_results.html'
+
+    def get_window(self):
+        return search_window(settings.SEARCH_RATE_LIMIT,
+                             settings.SEARCH_RATE_LIMIT_WINDOW)
+
+    async def get(self, request, *args, **kwargs):
+        query = self.request.GET.get('q')
+        if not query:
+            return await arender(request, 'movies/empty_search.html', {})
+        await get_user(request)
+        retry_after = await sync_to_async(self.get_window().attempt)(
+            client_id(request))
+        if retry_after:
+            await sync_to_async(caching.count)('search', 'throttled')
+            response = await arender(request, 'errors/429.html', {})
+            response.status_code = 429
+            response['Retry-After'] = str(int(retry_after) + 1)
+            return response
+        results, counts = await asearch(query)
+        return await arender(request, self.template_name, {
+            'results': results,
+            'counts': counts,
+            'query': query,
+            'number_of_results': sum(count or 0 for count in counts.values()),
+            'incomplete': None in counts.values(),
+        })
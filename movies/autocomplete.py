@@ -0,0 +1,111 @@
+"""
+Sorted prefix index for search-as-you-type.
+
+Every word of every movie title, actor, director and genre name is a key
+in one sorted list, so a prefix lookup is a binary search followed by
+a short scan. The list is built once per process and rebuilt when the
+'autocomplete' cache version is bumped by movies.signals. Rebuilds run
+in a background thread while the old list is still served, so requests
+never wait for one.
+"""
+import bisect
+import re
+import threading
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+from taggit.models import Tag
+from movies import caching
+from movies.models import Movie, Director, Actor
+
+WORD_RE = re.compile(r'\w+')
+
+# Limits the scan for short prefixes like 'a', which match many keys
+MAX_SCANNED_KEYS = 500
+
+SOURCES = [
+    ('movie', Movie, 'title', 'slug', 'movies:movie-detail'),
+    ('actor', Actor, 'name', 'slugged_name', 'movies:actor-page'),
+    ('director', Director, 'name', 'slugged_name', 'movies:director-page'),
+    ('genre', Tag, 'name', 'slug', 'movies:genre-movies'),
+]
+
+# Held while the index is rebuilt, so only one rebuild runs at a time
+_rebuilding = threading.Lock()
+# Replaced as a whole, so readers never see keys and entries of
+# different versions
+_index = {'version': None, 'keys': [], 'entries': []}
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+def build_entries():
+    entries = []
+    for kind, model, field, slug_field, url_name in SOURCES:
+        for label, slug in model.objects.values_list(field, slug_field).iterator():
+            url = reverse(url_name, args=(slug, ))
+            words = normalize(label).split()
+            # Key every suffix of words, so 'pitt' and 'brad pi' both
+            # find 'Brad Pitt', the whole name sorts before the rest
+            for position in range(len(words)):
+                key = ' '.join(words[position:])
+                entries.append((key, position, kind, label, url))
+    entries.sort()
+    return entries
+
+
+def rebuild(version):
+    global _index
+    entries = build_entries()
+    _index = {'version': version, 'entries': entries,
+              'keys': [entry[0] for entry in entries]}
+
+
+def rebuild_in_background(version):
+    try:
+        rebuild(version)
+    finally:
+        connections.close_all()
+        _rebuilding.release()
+
+
+def get_index():
+    version = caching.version_token(['autocomplete'])
+    if _index['version'] is None:
+        # Nothing to serve yet
+        with _rebuilding:
+            if _index['version'] is None:
+                rebuild(version)
+    elif _index['version'] != version and _rebuilding.acquire(blocking=False):
+        if settings.AUTOCOMPLETE_REBUILD_IN_BACKGROUND:
+            threading.Thread(target=rebuild_in_background, args=(version, ),
+                             name='autocomplete', daemon=True).start()
+        else:
+            try:
+                rebuild(version)
+            finally:
+                _rebuilding.release()
+    return _index
+
+
+def complete(text, limit):
+    prefix = normalize(text)
+    if not prefix:
+        return []
+    index = get_index()
+    keys, entries = index['keys'], index['entries']
+    start = bisect.bisect_left(keys, prefix)
+    results = []
+    seen = set()
+    for key, _, kind, label, url in entries[start:start + MAX_SCANNED_KEYS]:
+        if not key.startswith(prefix):
+            break
+        if url in seen:
+            continue
+        seen.add(url)
+        results.append({'type': kind, 'label': label, 'url': url})
+        if len(results) == limit:
+            break
+    return results
@@ -0,0 +1,186 @@
+"""
+Versioned cache for read-heavy movie pages.
+
+Every cached value is stored together with the versions of the
+dependencies it was built from, e.g. 'movie:42' or 'genre:3'.
+Model signals bump the version of changed objects (see movies.signals),
+which makes every entry built from them stale without knowing its key.
+Works with any Django cache backend (local memory, file, Redis).
+
+Versions are the times (ns) of the last bump. A value read from a
+replica less than REPLICA_PIN_SECONDS after a bump of one of its
+dependencies is not stored, replication may not have caught up.
+
+Every bump also changes a global generation. It is read before a value
+is built and again after the versions to store it with, and the value
+is not stored if it changed, as it may have been built from rows older
+than the versions.
+"""
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from cookie import routers
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+ENTRY_PREFIX = 'movies:entry:'
+VERSION_PREFIX = 'movies:version:'
+STATS_PREFIX = 'movies:stats:'
+GENERATION_KEY = 'movies:generation'
+
+
+def get_cache():
+    return caches[settings.MOVIES_CACHE_ALIAS]
+
+
+def make_key(prefix, name):
+    # Slugs may be long or contain characters memcached rejects
+    return prefix + hashlib.md5(name.encode()).hexdigest()
+
+
+def dependency(kind, pk):
+    return f'{kind}:{pk}'
+
+
+def get_versions(dependencies, timeout=None):
+    cache = get_cache()
+    keys = {make_key(VERSION_PREFIX, dep): dep for dep in dependencies}
+    found = cache.get_many(keys)
+    # A missing (never set or evicted) version gets a fresh value,
+    # so entries built against the lost version can never match again
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def versions_match(versions):
+    # Missing versions are not set, the entry is stale either way
+    keys = {make_key(VERSION_PREFIX, dep): dep for dep in versions}
+    found = get_cache().get_many(keys)
+    return {keys[key]: version for key, version in found.items()} == versions
+
+
+def version_token(dependencies):
+    versions = get_versions(dependencies)
+    return hashlib.md5(repr(sorted(versions.items())).encode()).hexdigest()
+
+
+def invalidate(*dependencies):
+    cache = get_cache()
+    # Generation first, so a build that sees any of the new
+    # versions also sees the new generation
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+    now = time.time_ns()
+    cache.set_many({make_key(VERSION_PREFIX, dep): now
+                    for dep in dependencies}, None)
+
+
+def invalidate_on_commit(*dependencies):
+    # Bump right away and once more after commit, so a page rebuilt
+    # from not yet committed data does not stay in the cache
+    invalidate(*dependencies)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: invalidate(*dependencies))
+
+
+def stats_key(group, counter):
+    return f'{STATS_PREFIX}{group}:{counter}'
+
+
+def count(group, counter):
+    cache = get_cache()
+    key = stats_key(group, counter)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def lookup(key, stats='pages'):
+    """
+    Return (found, value, generation) of the entry stored under key,
+    generation is to be passed to store() if value is built instead.
+    """
+    entry_key = make_key(ENTRY_PREFIX, key)
+    found = get_cache().get_many([entry_key, GENERATION_KEY])
+    generation = found.get(GENERATION_KEY)
+    entry = found.get(entry_key)
+    if entry is not None:
+        versions, value = entry
+        if versions_match(versions):
+            count(stats, 'hits')
+            return True, value, generation
+    count(stats, 'misses')
+    return False, None, generation
+
+
+def store(key, value, dependencies, generation, timeout=None):
+    if timeout is None:
+        timeout = settings.MOVIES_CACHE_TIMEOUT
+    cache = get_cache()
+    # A value of None is nothing found, e.g. an unknown slug. Versions
+    # set for it expire, so ones of slugs made up by crawlers do not
+    # pile up, and outlive the entry
+    versions = get_versions(dependencies, 2 * settings.MOVIES_CACHE_TIMEOUT
+                            if value is None else None)
+    if cache.get(GENERATION_KEY) != generation:
+        # Something changed while value was built
+        return
+    if routers.reading_from_replica():
+        # Also true for versions that were missing, which were just set
+        changed_since = time.time_ns() - settings.REPLICA_PIN_SECONDS * 10 ** 9
+        if any(version > changed_since for version in versions.values()):
+            return
+    cache.set(make_key(ENTRY_PREFIX, key), (versions, value), timeout)
+
+
+def cached(key, build, timeout=None, stats='pages'):
+    """
+    Return value stored under key, calling build() on a miss.
+    build() must return (value, dependencies), dependencies of None
+    mean the value must not be stored, a value of None means nothing
+    was found and its versions expire.
+    Hits and misses are counted in the stats group.
+    """
+    found, value, generation = lookup(key, stats)
+    if found:
+        return value
+    value, dependencies = build()
+    if dependencies is not None:
+        store(key, value, dependencies, generation, timeout)
+    return value
+
+
+async def acached(key, build, timeout=None, stats='pages'):
+    """cached() for async views, build is a coroutine function."""
+    found, value, generation = await sync_to_async(lookup)(key, stats)
+    if found:
+        return value
+    value, dependencies = await build()
+    if dependencies is not None:
+        await sync_to_async(store)(key, value, dependencies, generation, timeout)
+    return value
+
+
+def get_counters(group, *counters):
+    keys = {stats_key(group, counter): counter for counter in counters}
+    found = get_cache().get_many(keys)
+    return {counter: found.get(key, 0) for key, counter in keys.items()}
+
+
+def get_stats(group='pages'):
+    stats = get_counters(group, 'hits', 'misses')
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def reset_stats(group='pages', *counters):
+    counters = counters or ('hits', 'misses')
+    get_cache().delete_many([stats_key(group, counter) for counter in counters])
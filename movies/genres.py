@@ -0,0 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
+from taggit.models import Tag
+from movies import caching
+from movies.models import Movie
+
+GENRE_INDEX_CACHE_KEY = 'genre-index'
+
+
+def genre_index_queryset():
+    # One GROUP BY over movie tag assignments, tags used only
+    # by other models are not listed
+    movie_content_type = ContentType.objects.get_for_model(Movie)
+    return Tag.objects.\
+        filter(taggit_taggeditem_items__content_type=movie_content_type).\
+        annotate(number_of_movies=Count('taggit_taggeditem_items')).\
+        order_by('name')
+
+
+def build_genre_index():
+    return list(genre_index_queryset()), ['genres']
+
+
+async def abuild_genre_index():
+    # get_for_model() may query the content types table
+    queryset = await sync_to_async(genre_index_queryset)()
+    return [genre async for genre in queryset], ['genres']
+
+
+def get_genre_index():
+    return caching.cached(GENRE_INDEX_CACHE_KEY, build_genre_index)
+
+
+async def aget_genre_index():
+    return await caching.acached(GENRE_INDEX_CACHE_KEY, abuild_genre_index)
@@ -0,0 +1,50 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from movies.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Measures latency of a request cycle that reads one page of ' \
+        'movie cards, with connections closed after every request ' \
+        '(CONN_MAX_AGE=0) and kept between requests. Point DB_HOST and ' \
+        'DB_PORT at a pooler such as PgBouncer to measure it as well.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def request_cycle(self, alias):
+        # Same signals the request handler sends, they open
+        # and close connections according to CONN_MAX_AGE
+        start = time.perf_counter()
+        request_started.send(sender=self.__class__)
+        list(Movie.objects.using(alias).cards()[:24])
+        request_finished.send(sender=self.__class__)
+        return (time.perf_counter() - start) * 1000
+
+    def measure(self, alias, conn_max_age, number):
+        connection = connections[alias]
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        try:
+            # The first request connects in both modes
+            self.request_cycle(alias)
+            return [self.request_cycle(alias) for _ in range(number)]
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        for name, conn_max_age in [('new connection', 0), ('persistent', None)]:
+            latencies = sorted(self.measure(alias, conn_max_age,
+                                            options['requests']))
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f'{name:<15} mean: {statistics.mean(latencies):7.2f} ms   '
+                f'median: {statistics.median(latencies):7.2f} ms   '
+                f'p95: {p95:7.2f} ms')
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from movies import async_views, views
+from movies.models import Movie, Director, Actor
+
+
+class Command(BaseCommand):
+    help = 'Compares throughput of sync and async read-only movie pages. ' \
+        'Views are called in process, so no server is needed. ' \
+        'Run with CACHE_URL=dummycache:// to measure database access ' \
+        'instead of cache hits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per page and mode')
+        parser.add_argument('--concurrency', type=int, default=10,
+                            help='Threads for sync views, '
+                            'concurrent tasks for async views')
+
+    def get_pages(self):
+        pages = [('index', 'IndexView', '/', {})]
+        movie = Movie.objects.first()
+        if movie:
+            pages.append(('detail', 'MovieDetailView', '/',
+                          {'slug': movie.slug}))
+        director = Director.objects.first()
+        if director:
+            pages.append(('director', 'DirectorPageView', '/',
+                          {'slug': director.slugged_name}))
+        actor = Actor.objects.first()
+        if actor:
+            pages.append(('actor', 'ActorPageView', '/',
+                          {'slug': actor.slugged_name}))
+        pages.append(('search', 'SearchResultsView', '/search/?q=the', {}))
+        return pages
+
+    def run_sync(self, view, path, kwargs, number, concurrency):
+        def call(_):
+            request = RequestFactory().get(path)
+            request.user = AnonymousUser()
+            return view(request, **kwargs).status_code
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(call, range(number)))
+
+    async def run_async(self, view, path, kwargs, number, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                request = AsyncRequestFactory().get(path)
+                request.user = AnonymousUser()
+                response = await view(request, **kwargs)
+                return response.status_code
+
+        return await asyncio.gather(*[call() for _ in range(number)])
+
+    def measure(self, run, *args):
+        start = time.perf_counter()
+        statuses = run(*args)
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for status in statuses if status != 200)
+        return len(statuses) / elapsed, failed
+
+    @override_settings(SEARCH_RATE_LIMIT=0)
+    def handle(self, *args, **options):
+        number = options['requests']
+        concurrency = options['concurrency']
+        for name, view_name, path, kwargs in self.get_pages():
+            sync_view = getattr(views, view_name).as_view()
+            async_view = getattr(async_views, view_name).as_view()
+            sync_rate, sync_failed = self.measure(
+                self.run_sync, sync_view, path, kwargs, number, concurrency)
+            async_rate, async_failed = self.measure(
+                asyncio.run, self.run_async(async_view, path, kwargs,
+                                            number, concurrency))
+            self.stdout.write(
+                f'{name:<10} sync: {sync_rate:8.1f} req/s   '
+                f'async: {async_rate:8.1f} req/s')
+            if sync_failed or async_failed:
+                self.stdout.write(self.style.WARNING(
+                    f'{name:<10} non-200 responses: sync {sync_failed}, '
+                    f'async {async_failed}'))
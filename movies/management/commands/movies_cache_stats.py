@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from movies import caching
+
+
+class Command(BaseCommand):
+    help = 'Shows hit/miss counters of the movies page, slug and search caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset counters after showing them')
+
+    def handle(self, *args, **options):
+        for group in ('pages', 'slugs', 'search'):
+            stats = caching.get_stats(group)
+            self.stdout.write(f'{group}:')
+            self.stdout.write(f"  hits: {stats['hits']}")
+            self.stdout.write(f"  misses: {stats['misses']}")
+            self.stdout.write(f"  hit rate: {stats['hit_rate']:.2%}")
+        throttled = caching.get_counters('search', 'throttled')['throttled']
+        self.stdout.write(f'throttled searches: {throttled}')
+        if options['reset']:
+            caching.reset_stats('pages')
+            caching.reset_stats('slugs')
+            caching.reset_stats('search', 'hits', 'misses', 'throttled')
+            self.stdout.write(self.style.SUCCESS('Counters were reset'))
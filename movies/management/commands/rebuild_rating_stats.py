@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from movies.models import MovieRatingStats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes per-movie rating stats from the ratings table'
+
+    def handle(self, *args, **options):
+        number_of_movies = MovieRatingStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating stats for {number_of_movies} movie(s)'))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import movies.models
+
+
+def populate_rating_stats(apps, schema_editor):
+    Rating = apps.get_model('movies', 'Rating')
+    MovieRatingStats = apps.get_model('movies', 'MovieRatingStats')
+    stats = {}
+    rows = Rating.objects.values('movie_id', 'rating').\
+        annotate(number=models.Count('id')).order_by()
+    for row in rows:
+        movie_stats = stats.setdefault(row['movie_id'], MovieRatingStats(
+            movie_id=row['movie_id'], histogram=movies.models.empty_histogram()))
+        movie_stats.rating_sum += row['rating'] * row['number']
+        movie_stats.rating_count += row['number']
+        movie_stats.histogram[row['rating']] += row['number']
+    MovieRatingStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_alter_rating_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRatingStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='movies.movie')),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('histogram', models.JSONField(default=movies.models.empty_histogram)),
+            ],
+        ),
+        migrations.RunPython(populate_rating_stats,
+                             migrations.RunPython.noop),
+    ]
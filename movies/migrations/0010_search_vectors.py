@@ -0,0 +1,106 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:14
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Titles are indexed with both configurations, so that stop words and
+# exact words match ('simple') as well as stemmed forms ('english')
+MOVIE_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}synopsis, '')), 'B')
+"""
+PERSON_VECTOR = "to_tsvector('simple', coalesce({row}name, ''))"
+
+SEARCH_TABLES = [
+    ('movies_movie', MOVIE_VECTOR, 'title'),
+    ('movies_director', PERSON_VECTOR, 'name'),
+    ('movies_actor', PERSON_VECTOR, 'name'),
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, vector, _ in SEARCH_TABLES:
+        schema_editor.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}_search_vector_update()
+            RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {vector.format(row='NEW.')};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+        """)
+        schema_editor.execute(f"""
+            CREATE TRIGGER {table}_search_vector_trigger
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update();
+        """)
+        schema_editor.execute(
+            f"UPDATE {table} SET search_vector = {vector.format(row='')};")
+        schema_editor.execute(
+            f"CREATE INDEX {table}_search_vector_gin "
+            f"ON {table} USING gin (search_vector);")
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, _, _ in SEARCH_TABLES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_vector_gin;")
+        schema_editor.execute(
+            f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};")
+        schema_editor.execute(
+            f"DROP FUNCTION IF EXISTS {table}_search_vector_update();")
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm ships with postgresql-contrib, which is not installed
+    # everywhere, search works without it but cannot correct typos
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    for table, _, column in SEARCH_TABLES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_{column}_trgm "
+            f"ON {table} USING gin ({column} gin_trgm_ops);")
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, _, column in SEARCH_TABLES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_{column}_trgm;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_movieratingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actor',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='director',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:48
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    """AddIndexConcurrently on PostgreSQL, a plain AddIndex elsewhere."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the tables against writes,
+    # which cannot be done inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('movies', '0010_search_vectors'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name='movie',
+            index=models.Index(fields=['director', 'title', 'id'], name='movie_director_title_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='movie',
+            index=models.Index(fields=['director', '-release_date', '-id'], name='movie_director_released_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='rating',
+            index=models.Index(fields=['movie', 'rating'], name='rating_movie_rating_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='review',
+            index=models.Index(fields=['movie', '-published', '-id'], name='review_movie_published_idx'),
+        ),
+    ]
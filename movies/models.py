@@ -1,7 +1,11 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models, transaction
+from django.db.models import F, FloatField, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.core.exceptions import ValidationError
 from django.template.defaultfilters import slugify
 from taggit.managers import TaggableManager
+from movies.caching import dependency, invalidate_on_commit
 
 
 def validate_file_size(file):
@@ -16,6 +20,8 @@ class Director(models.Model):
     slugged_name = models.SlugField(max_length=300, unique=True)
     photo = models.ImageField(
         upload_to='movies/images/', validators=[validate_file_size])
+    # Maintained by a database trigger, see migration 0010
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def save(self, *args, **kwargs):
         self.slugged_name = slugify(self.name)
@@ -33,6 +39,8 @@ class Actor(models.Model):
     slugged_name = models.SlugField(max_length=300, unique=True)
     photo = models.ImageField(
         upload_to='movies/images/', validators=[validate_file_size])
+    # Maintained by a database trigger, see migration 0010
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def save(self, *args, **kwargs):
         self.slugged_name = slugify(self.name)
@@ -45,6 +53,35 @@ class Actor(models.Model):
         ordering = ['name']
 
 
+class MovieQuerySet(models.QuerySet):
+    # Columns rendered by movie cards on genre, director and actor pages
+    CARD_FIELDS = (
+        'title', 'slug', 'poster', 'country', 'release_date',
+        'director', 'director__name', 'director__slugged_name'
+    )
+
+    def with_genres(self):
+        return self.prefetch_related('genres')
+
+    def with_actors(self):
+        return self.prefetch_related(Prefetch(
+            'actors', queryset=Actor.objects.only('name', 'slugged_name')))
+
+    def cards(self):
+        return self.select_related('director').only(*self.CARD_FIELDS).\
+            with_genres().with_rating_stats()
+
+    def with_rating_stats(self):
+        # Reads the precomputed aggregate instead of running
+        # Avg/Count over the whole ratings table
+        return self.annotate(
+            avg_rating=Cast(F('rating_stats__rating_sum'), FloatField()) /
+            NullIf(F('rating_stats__rating_count'), 0),
+            number_of_ratings=Coalesce(
+                F('rating_stats__rating_count'), Value(0))
+        )
+
+
 class Movie(models.Model):
     UNITED_STATES = 'US'
     UNITED_KINGDOM = 'UK'
@@ -75,15 +112,63 @@ class Movie(models.Model):
     genres = TaggableManager(
         verbose_name='genres', help_text='A comma-separated list of genres.'
     )
+    # Maintained by a database trigger, see migration 0010
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        # Director pages filter by director and order by a sort
+        # field, then by id for keyset pagination
+        indexes = [
+            models.Index(fields=['director', 'title', 'id'],
+                         name='movie_director_title_idx'),
+            models.Index(fields=['director', '-release_date', '-id'],
+                         name='movie_director_released_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title)
-        super(Movie, self).save(*args, **kwargs)
+        with transaction.atomic():
+            previous_slug = None
+            if self.pk is not None:
+                previous_slug = Movie.objects.filter(pk=self.pk).\
+                    exclude(slug=self.slug).values_list('slug', flat=True).first()
+            super(Movie, self).save(*args, **kwargs)
+            # Old URLs redirect to the new slug, a slug in use
+            # by a movie is never redirected
+            SlugHistory.objects.filter(slug=self.slug).delete()
+            if previous_slug is not None:
+                SlugHistory.objects.update_or_create(
+                    slug=previous_slug, defaults={'movie': self})
 
     def __str__(self):
         return self.title
 
 
+class SlugHistory(models.Model):
+    """Slugs a movie had before its title was changed."""
+    slug = models.SlugField(max_length=300, unique=True)
+    movie = models.ForeignKey(
+        Movie, related_name='old_slugs', on_delete=models.CASCADE)
+    changed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'slug history'
+
+    def __str__(self):
+        return self.slug
+
+
+class ReviewQuerySet(models.QuerySet):
+    def with_owner_rating(self):
+        # Rating the review's author gave to the movie, None if not rated
+        ratings = Rating.objects.filter(movie=OuterRef('movie'),
+                                        owner=OuterRef('owner'))
+        return self.annotate(
+            owner_rating=Subquery(ratings.values('rating')[:1]))
+
+
 class Review(models.Model):
     movie = models.ForeignKey(
         Movie, related_name='reviews', on_delete=models.CASCADE)
@@ -93,13 +178,53 @@ class Review(models.Model):
     published = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ReviewQuerySet.as_manager()
+
     class Meta:
         unique_together = ("movie", "owner")
+        # Review list, newest first with id as keyset tie-breaker
+        indexes = [
+            models.Index(fields=['movie', '-published', '-id'],
+                         name='review_movie_published_idx'),
+        ]
 
     def __str__(self):
         return self.movie.title + ' ' + self.owner.username
 
 
+class RatingQuerySet(models.QuerySet):
+    def upsert(self, movie, owner, rating):
+        """
+        Insert or update owner's rating of the movie with one statement.
+        Return the previous rating, None if there was none.
+        No post_save signal is sent.
+        """
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            existing = self.select_for_update().\
+                filter(movie=movie, owner=owner).first()
+            if existing is None:
+                self.create(movie=movie, owner=owner, rating=rating)
+                return None
+            self.filter(id=existing.id).update(rating=rating)
+            return existing.rating
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            # previous sees the row as it was before the statement
+            cursor.execute(f"""
+                WITH previous AS (
+                    SELECT rating FROM {table}
+                    WHERE movie_id = %s AND owner_id = %s
+                )
+                INSERT INTO {table} (movie_id, owner_id, rating)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (movie_id, owner_id)
+                DO UPDATE SET rating = EXCLUDED.rating
+                RETURNING (SELECT rating FROM previous)
+            """, [movie.id, owner.pk, movie.id, owner.pk, rating])
+            return cursor.fetchone()[0]
+
+
 class Rating(models.Model):
     rating_choices = [(0, 0), (1, 1), (2, 2), (3, 3), (4, 4), (5, 5),
                       (6, 6), (7, 7), (8, 8), (9, 9), (10, 10)]
@@ -110,8 +235,125 @@ class Rating(models.Model):
     )
     rating = models.PositiveSmallIntegerField(choices=rating_choices)
 
+    objects = RatingQuerySet.as_manager()
+
     class Meta:
         unique_together = ("movie", "owner")
+        # Covers counting ratings of a movie by value, without reading
+        # the table (see MovieRatingStats.aggregate_ratings)
+        indexes = [
+            models.Index(fields=['movie', 'rating'],
+                         name='rating_movie_rating_idx'),
+        ]
 
     def __str__(self):
         return self.movie.title + ' ' + self.owner.username
+
+
+def empty_histogram():
+    return [0] * len(Rating.rating_choices)
+
+
+class MovieRatingStats(models.Model):
+    movie = models.OneToOneField(
+        Movie, related_name='rating_stats', on_delete=models.CASCADE,
+        primary_key=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # histogram[n] is the number of ratings equal to n
+    histogram = models.JSONField(default=empty_histogram)
+
+    @property
+    def avg_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @classmethod
+    def locked(cls, movie):
+        """
+        Return stats of the movie locked until the end of the transaction.
+        Taking the lock before writing to Rating makes rating writes of
+        one movie run one at a time.
+        """
+        stats, created = cls.objects.select_for_update().\
+            get_or_create(movie=movie)
+        if created:
+            computed = cls.aggregate_ratings(
+                Rating.objects.filter(movie=movie)).get(movie.id)
+            if computed is not None:
+                stats.rating_sum = computed.rating_sum
+                stats.rating_count = computed.rating_count
+                stats.histogram = computed.histogram
+                stats.save()
+        return stats
+
+    def change(self, added=None, removed=None):
+        if removed is not None:
+            self.rating_sum -= removed
+            self.rating_count -= 1
+            self.histogram[removed] -= 1
+        if added is not None:
+            self.rating_sum += added
+            self.rating_count += 1
+            self.histogram[added] += 1
+        self.save()
+
+    @classmethod
+    @transaction.atomic
+    def rate(cls, movie, owner, rating):
+        """Create or update owner's rating, return new stats of the movie."""
+        stats = cls.locked(movie)
+        previous = Rating.objects.upsert(movie, owner, rating)
+        stats.change(added=rating, removed=previous)
+        # Done by movies.signals for ORM writes
+        invalidate_on_commit(dependency('movie', movie.id))
+        return stats
+
+    @classmethod
+    @transaction.atomic
+    def unrate(cls, movie, owner):
+        """Delete owner's rating if any, return new stats of the movie."""
+        stats = cls.locked(movie)
+        rating = Rating.objects.filter(movie=movie, owner=owner).first()
+        if rating is not None:
+            # Stats are changed by movies.signals, as for cascade deletes
+            rating.delete()
+            stats.refresh_from_db()
+        return stats
+
+    @classmethod
+    def rating_deleted(cls, rating):
+        """Take a deleted rating out of the stats of its movie."""
+        # No row to change if the movie itself is being deleted, or its
+        # stats are still to be computed from the ratings table
+        stats = cls.objects.select_for_update().\
+            filter(movie_id=rating.movie_id).first()
+        if stats is not None:
+            stats.change(removed=rating.rating)
+
+    @classmethod
+    def aggregate_ratings(cls, ratings):
+        stats = {}
+        rows = ratings.values('movie_id', 'rating').\
+            annotate(number=models.Count('*')).order_by()
+        for row in rows:
+            movie_stats = stats.setdefault(
+                row['movie_id'], cls(movie_id=row['movie_id']))
+            movie_stats.rating_sum += row['rating'] * row['number']
+            movie_stats.rating_count += row['number']
+            movie_stats.histogram[row['rating']] += row['number']
+        return stats
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls):
+        # Lock existing rows so rating views wait for the rebuild
+        list(cls.objects.select_for_update())
+        stats = cls.aggregate_ratings(Rating.objects.all())
+        cls.objects.all().delete()
+        cls.objects.bulk_create(stats.values())
+        return len(stats)
+
+    def __str__(self):
+        return self.movie.title + ' ' + str(self.rating_count)
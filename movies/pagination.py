@@ -0,0 +1,103 @@
+import base64
+import json
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """
+    Paginates by the last seen (value, id) pair instead of OFFSET, so
+    every page costs the same index range scan as the first one.
+    ordering is a single field name, optionally prefixed with '-',
+    id is always used as the tie breaker.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        self.per_page = per_page
+
+    def encode_cursor(self, obj):
+        model_field = self.queryset.model._meta.get_field(self.field)
+        value = model_field.value_to_string(obj)
+        data = json.dumps([value, obj.pk]).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        model_field = self.queryset.model._meta.get_field(self.field)
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, pk = json.loads(data)
+            return model_field.to_python(value), int(pk)
+        except Exception:
+            raise Http404('Invalid page cursor')
+
+    def ordered(self, cursor=None, forward=True):
+        """Queryset in page order, starting right after cursor."""
+        # Going backwards reads the index in the opposite direction
+        descending = self.descending if forward else not self.descending
+        lookup = 'lt' if descending else 'gt'
+        prefix = '-' if descending else ''
+        queryset = self.queryset
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) |
+                Q(**{self.field: value, f'pk__{lookup}': pk})
+            )
+        return queryset.order_by(f'{prefix}{self.field}', f'{prefix}pk')
+
+    def get_page(self, after=None, before=None):
+        forward = not before
+        cursor = after if forward else before
+        queryset = self.ordered(cursor, forward)
+        return self.make_page(list(queryset[:self.per_page + 1]), cursor, forward)
+
+    async def aget_page(self, after=None, before=None):
+        forward = not before
+        cursor = after if forward else before
+        queryset = self.ordered(cursor, forward)
+        objects = [obj async for obj in queryset[:self.per_page + 1]]
+        return self.make_page(objects, cursor, forward)
+
+    def make_page(self, objects, cursor, forward):
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if not forward:
+            # Restore the order of a page read backwards
+            objects.reverse()
+        if not objects:
+            return KeysetPage(objects)
+        has_next = has_more if forward else True
+        has_previous = bool(cursor) if forward else has_more
+        return KeysetPage(
+            objects,
+            next_cursor=self.encode_cursor(objects[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(
+                objects[0]) if has_previous else None
+        )
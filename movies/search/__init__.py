@@ -0,0 +1,86 @@
+import logging
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils.module_loading import import_string
+from movies import caching
+
+logger = logging.getLogger(__name__)
+
+_backends = {}
+
+
+def get_backend(path=None):
+    path = path or settings.SEARCH_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def get_backends():
+    # Every configured backend has to see model changes,
+    # the fallback one is of no use if its index is stale
+    paths = [settings.SEARCH_BACKEND, settings.SEARCH_FALLBACK_BACKEND]
+    return [get_backend(path) for path in dict.fromkeys(paths) if path]
+
+
+def normalize_query(text):
+    return ' '.join(text.casefold().split())
+
+
+def search_dependencies(counts):
+    # Sections that timed out have no count, such results are not cached
+    if None in counts.values():
+        return None
+    return ['search']
+
+
+def search(text, limit=None):
+    """
+    Return (results, counts) for the query, cached by normalized text
+    until SEARCH_CACHE_TIMEOUT passes or a searched model changes.
+    """
+    limit = limit or settings.SEARCH_RESULTS_PER_SECTION
+    text = normalize_query(text)
+
+    def build():
+        results, counts = search_uncached(text, limit)
+        return (results, counts), search_dependencies(counts)
+
+    return caching.cached(f'search:{limit}:{text}', build,
+                          timeout=settings.SEARCH_CACHE_TIMEOUT, stats='search')
+
+
+async def asearch(text, limit=None):
+    limit = limit or settings.SEARCH_RESULTS_PER_SECTION
+    text = normalize_query(text)
+
+    async def build():
+        results, counts = await asearch_uncached(text, limit)
+        return (results, counts), search_dependencies(counts)
+
+    return await caching.acached(f'search:{limit}:{text}', build,
+                                 timeout=settings.SEARCH_CACHE_TIMEOUT,
+                                 stats='search')
+
+
+def search_uncached(text, limit):
+    try:
+        return get_backend().search(text, limit)
+    except DatabaseError:
+        if not settings.SEARCH_FALLBACK_BACKEND:
+            raise
+        logger.warning('Search backend failed, using %s',
+                       settings.SEARCH_FALLBACK_BACKEND, exc_info=True)
+        return get_backend(settings.SEARCH_FALLBACK_BACKEND).search(text, limit)
+
+
+async def asearch_uncached(text, limit):
+    try:
+        return await get_backend().asearch(text, limit)
+    except DatabaseError:
+        if not settings.SEARCH_FALLBACK_BACKEND:
+            raise
+        logger.warning('Search backend failed, using %s',
+                       settings.SEARCH_FALLBACK_BACKEND, exc_info=True)
+        return await get_backend(settings.SEARCH_FALLBACK_BACKEND).\
+            asearch(text, limit)
@@ -0,0 +1,33 @@
+from asgiref.sync import sync_to_async
+
+SECTIONS = ('actors', 'directors', 'movies', 'genres')
+
+
+class SearchBackend:
+    """
+    Interface of search backends used by SearchResultsView.
+    search() returns two dicts keyed by SECTIONS: lists of found
+    objects (at most limit per section) and total numbers of matches,
+    None for sections that did not finish in time.
+    """
+
+    def search(self, text, limit):
+        raise NotImplementedError
+
+    async def asearch(self, text, limit):
+        return await sync_to_async(self.search)(text, limit)
+
+    def update(self, instance):
+        # Called from model signals after an indexed object was saved
+        pass
+
+    def remove(self, model, pk):
+        # Called from model signals after an indexed object was deleted
+        pass
+
+    def reset(self):
+        pass
+
+    def empty_results(self):
+        return ({section: [] for section in SECTIONS},
+                {section: 0 for section in SECTIONS})
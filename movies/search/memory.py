@@ -0,0 +1,176 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from taggit.models import Tag
+from movies.models import Movie, Director, Actor
+from movies.search.base import SearchBackend
+
+WORD_RE = re.compile(r'\w+')
+
+# section: (model, indexed field, other fields needed to render a link)
+INDEXED = {
+    'actors': (Actor, 'name', 'slugged_name'),
+    'directors': (Director, 'name', 'slugged_name'),
+    'movies': (Movie, 'title', 'slug'),
+    'genres': (Tag, 'name', 'slug'),
+}
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+def word_tokens(word):
+    # Short words are looked up by the whole word or its first letter,
+    # longer ones by their trigrams, so any substring of 3+ characters
+    # can be found
+    if len(word) < 3:
+        return {'^' + word[:n] for n in range(1, len(word) + 1)}
+    return {'^' + word[0], '^' + word[:2]} | \
+        {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def query_tokens(word):
+    if len(word) < 3:
+        return {'^' + word}
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def score(name, text):
+    if name == text:
+        return 0
+    if name.startswith(text):
+        return 1
+    words = name.split()
+    if all(any(w.startswith(q) for w in words) for q in text.split()):
+        return 2
+    return 3
+
+
+class Section:
+    def __init__(self, model, field, link_field):
+        self.model = model
+        self.field = field
+        self.link_field = link_field
+        self.documents = {}
+        self.postings = defaultdict(set)
+
+    def add(self, pk, name, link):
+        self.discard(pk)
+        normalized = normalize(name)
+        self.documents[pk] = (normalized, name, link)
+        for word in normalized.split():
+            for token in word_tokens(word):
+                self.postings[token].add(pk)
+
+    def discard(self, pk):
+        document = self.documents.pop(pk, None)
+        if document is None:
+            return
+        for word in document[0].split():
+            for token in word_tokens(word):
+                self.postings[token].discard(pk)
+                if not self.postings[token]:
+                    del self.postings[token]
+
+    def load(self):
+        self.documents = {}
+        self.postings = defaultdict(set)
+        rows = self.model.objects.values_list('pk', self.field, self.link_field)
+        for pk, name, link in rows.iterator():
+            self.add(pk, name, link)
+
+    def search(self, text, limit):
+        tokens = set()
+        for word in text.split():
+            tokens |= query_tokens(word)
+        candidates = None
+        for token in sorted(tokens, key=lambda t: len(self.postings.get(t, ()))):
+            posting = self.postings.get(token, set())
+            candidates = posting.copy() if candidates is None \
+                else candidates & posting
+            if not candidates:
+                return [], 0
+        # Tokens of different words may match, check the real text
+        matches = []
+        for pk in candidates:
+            normalized, name, link = self.documents[pk]
+            if all(word in normalized for word in text.split()):
+                matches.append((score(normalized, text), normalized, pk))
+        matches.sort()
+        results = []
+        for _, _, pk in matches[:limit]:
+            _, name, link = self.documents[pk]
+            results.append(self.model(
+                pk=pk, **{self.field: name, self.link_field: link}))
+        return results, len(matches)
+
+
+class InMemorySearchBackend(SearchBackend):
+    """
+    Inverted index of n-gram tokens kept in process memory. It is loaded
+    from the database on first use, kept up to date by model signals
+    and reloaded after SEARCH_MEMORY_INDEX_MAX_AGE seconds, since other
+    processes' changes are not seen by its signals.
+    Works on any database, used in tests and as a fallback backend.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sections = None
+        self.loaded_at = None
+
+    def load(self):
+        sections = {name: Section(*spec) for name, spec in INDEXED.items()}
+        for section in sections.values():
+            section.load()
+        self.sections = sections
+        self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        max_age = settings.SEARCH_MEMORY_INDEX_MAX_AGE
+        with self.lock:
+            if self.sections is None or \
+                    (max_age and time.monotonic() - self.loaded_at > max_age):
+                self.load()
+
+    def section_for(self, model):
+        for name, (indexed_model, _, _) in INDEXED.items():
+            if issubclass(model, indexed_model):
+                return name
+        return None
+
+    def search(self, text, limit):
+        results, counts = self.empty_results()
+        text = normalize(text)
+        if not text:
+            return results, counts
+        self.ensure_loaded()
+        with self.lock:
+            for name, section in self.sections.items():
+                results[name], counts[name] = section.search(text, limit)
+        return results, counts
+
+    def update(self, instance):
+        name = self.section_for(type(instance))
+        with self.lock:
+            # Not loaded yet, the object will be read with everything else
+            if self.sections is None or name is None:
+                return
+            section = self.sections[name]
+            section.add(instance.pk, getattr(instance, section.field),
+                        getattr(instance, section.link_field))
+
+    def remove(self, model, pk):
+        name = self.section_for(model)
+        with self.lock:
+            if self.sections is None or name is None:
+                return
+            self.sections[name].discard(pk)
+
+    def reset(self):
+        with self.lock:
+            self.sections = None
+            self.loaded_at = None
@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    TrigramSimilarity
+from django.db import close_old_connections, connections, router, \
+    transaction, DatabaseError
+from django.db.models import F
+from taggit.models import Tag
+from movies.models import Movie, Director, Actor
+from movies.search.base import SearchBackend
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+
+QUERY_CANCELED = '57014'
+
+_trigram_support = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def has_trigram_support(using='default'):
+    if using not in _trigram_support:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_support[using] = cursor.fetchone() is not None
+    return _trigram_support[using]
+
+
+def build_query(text):
+    # Every word of the query is matched as a prefix: "fight clu"
+    # becomes 'fight':* & 'clu':*
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    raw = ' & '.join(f"'{word}':*" for word in words)
+    return SearchQuery(raw, search_type='raw', config='simple') | \
+        SearchQuery(raw, search_type='raw', config='english')
+
+
+def limited(matches, limit, order_by):
+    results = list(matches.order_by(*order_by)[:limit])
+    # Only count when the limited list might not contain everything
+    count = len(results) if len(results) < limit else matches.count()
+    return results, count
+
+
+async def alimited(matches, limit, order_by):
+    results = [obj async for obj in matches.order_by(*order_by)[:limit]]
+    count = len(results) if len(results) < limit else await matches.acount()
+    return results, count
+
+
+def search_section(queryset, text, query, name_field, limit):
+    matches = queryset.filter(search_vector=query).\
+        annotate(rank=SearchRank(F('search_vector'), query))
+    results, count = limited(matches, limit, ['-rank', name_field])
+    if not results and has_trigram_support(queryset.db):
+        # Nothing matched word by word, look for misspellings
+        matches = queryset.\
+            filter(**{f'{name_field}__trigram_similar': text}).\
+            annotate(rank=TrigramSimilarity(name_field, text))
+        results, count = limited(matches, limit, ['-rank', name_field])
+    return results, count
+
+
+async def asearch_section(queryset, text, query, name_field, limit):
+    matches = queryset.filter(search_vector=query).\
+        annotate(rank=SearchRank(F('search_vector'), query))
+    results, count = await alimited(matches, limit, ['-rank', name_field])
+    if not results and await sync_to_async(has_trigram_support)(queryset.db):
+        matches = queryset.\
+            filter(**{f'{name_field}__trigram_similar': text}).\
+            annotate(rank=TrigramSimilarity(name_field, text))
+        results, count = await alimited(matches, limit, ['-rank', name_field])
+    return results, count
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SEARCH_THREADS,
+                thread_name_prefix='search')
+    return _executor
+
+
+def run_with_timeout(function, *args):
+    using = router.db_for_read(Movie)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            # Do not leave a query running after the view gave up on
+            # it. SET LOCAL ends with the transaction, so it does not
+            # leak to other clients of a pooled server connection
+            timeout = int(settings.SEARCH_SECTION_TIMEOUT * 1000)
+            cursor.execute(f'SET LOCAL statement_timeout = {timeout}')
+        return function(*args)
+
+
+def run_in_worker(function, *args):
+    # Worker threads have their own connections, which are closed
+    # or kept like request connections, according to CONN_MAX_AGE
+    close_old_connections()
+    try:
+        return run_with_timeout(function, *args)
+    finally:
+        close_old_connections()
+
+
+def is_canceled(exception):
+    return getattr(exception.__cause__, 'pgcode', None) == QUERY_CANCELED
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Full-text search over the trigger maintained search_vector columns
+    (see migration 0010), with trigram matching when pg_trgm is installed.
+    """
+
+    def sections(self):
+        return [
+            ('actors', Actor.objects.only('name', 'slugged_name'), 'name'),
+            ('directors', Director.objects.only('name', 'slugged_name'), 'name'),
+            ('movies', Movie.objects.only('title', 'slug'), 'title'),
+        ]
+
+    def genres(self, text):
+        # Genres table is small, a plain scan is fine
+        return Tag.objects.filter(name__icontains=text.strip())
+
+    def search(self, text, limit):
+        results, counts = self.empty_results()
+        query = build_query(text)
+        if query is None:
+            return results, counts
+        tasks = [(section, search_section,
+                  (queryset, text, query, name_field, limit))
+                 for section, queryset, name_field in self.sections()]
+        tasks.append(('genres', limited, (self.genres(text), limit, ['name'])))
+        if settings.SEARCH_CONCURRENT_SECTIONS:
+            return self.run_concurrently(tasks, results, counts)
+        for section, function, args in tasks:
+            results[section], counts[section] = function(*args)
+        return results, counts
+
+    def run_concurrently(self, tasks, results, counts):
+        """
+        Run sections in the search thread pool, latency is the slowest
+        section. Sections still queued are run by the request thread
+        itself, so time spent in the queue under load does not count.
+        Sections not done SEARCH_SECTION_TIMEOUT after they started are
+        left empty with a count of None.
+        """
+        executor = get_executor()
+        started = {}
+
+        def start(section, function, *args):
+            started[section] = time.monotonic()
+            return run_in_worker(function, *args)
+
+        # Copy the context, so sections read from the request's replica
+        futures = {executor.submit(contextvars.copy_context().run,
+                                   start, section, function, *args):
+                   (section, function, args)
+                   for section, function, args in tasks}
+        outcomes = {}
+        # Last submitted first, it is the least likely to be picked up
+        for future, (section, function, args) in reversed(futures.items()):
+            if future.cancel():
+                try:
+                    outcomes[section] = run_with_timeout(function, *args), None
+                except DatabaseError as exception:
+                    outcomes[section] = None, exception
+        for future, (section, _, _) in futures.items():
+            if future.cancelled():
+                continue
+            deadline = started.get(section, time.monotonic()) + \
+                settings.SEARCH_SECTION_TIMEOUT
+            wait([future], timeout=max(0, deadline - time.monotonic()))
+            if future.done():
+                exception = future.exception()
+                outcomes[section] = \
+                    (None if exception else future.result()), exception
+        for section, _, _ in tasks:
+            result, exception = outcomes.get(section, (None, None))
+            if result is not None:
+                results[section], counts[section] = result
+            elif exception is None or is_canceled(exception):
+                counts[section] = None
+            else:
+                raise exception
+        incomplete = [section for section, count in counts.items()
+                      if count is None]
+        if incomplete:
+            logger.warning('Search sections timed out: %s', ', '.join(incomplete))
+        return results, counts
+
+    async def asearch(self, text, limit):
+        results, counts = self.empty_results()
+        query = build_query(text)
+        if query is None:
+            return results, counts
+        sections = self.sections()
+        found = await asyncio.gather(
+            *[asearch_section(queryset, text, query, name_field, limit)
+              for _, queryset, name_field in sections],
+            alimited(self.genres(text), limit, ['name']))
+        names = [section for section, _, _ in sections] + ['genres']
+        for section, (section_results, count) in zip(names, found):
+            results[section], counts[section] = section_results, count
+        return results, counts
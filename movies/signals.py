@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+from movies.caching import dependency, invalidate_on_commit
+from movies.models import Movie, Director, Actor, Rating, Review, SlugHistory, \
+    MovieRatingStats
+from movies.search import get_backends
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def genre_changed(sender, instance, **kwargs):
+    invalidate_on_commit('genres', dependency('genre', instance.id),
+                         dependency('genre-slug', instance.slug))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def genre_assignment_changed(sender, instance, **kwargs):
+    invalidate_on_commit('genres', dependency('genre', instance.tag_id),
+                         dependency('movie', instance.object_id))
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def movie_changed(sender, instance, **kwargs):
+    invalidate_on_commit(dependency('movie', instance.id),
+                         dependency('movie-slug', instance.slug),
+                         dependency('director', instance.director_id))
+
+
+@receiver(post_save, sender=SlugHistory)
+@receiver(post_delete, sender=SlugHistory)
+def slug_history_changed(sender, instance, **kwargs):
+    invalidate_on_commit(dependency('movie-slug', instance.slug))
+
+
+@receiver(pre_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    # Cascade deletes of Movie.actors rows send no m2m_changed
+    invalidate_on_commit(*[
+        dependency('actor', pk)
+        for pk in instance.actors.values_list('id', flat=True)])
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def movie_actors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        related_ids = pk_set
+    elif action == 'pre_clear':
+        # pk_set is not provided on clear
+        related = instance.movie_set if reverse else instance.actors
+        related_ids = list(related.values_list('id', flat=True))
+    else:
+        return
+    if reverse:
+        actor_ids, movie_ids = [instance.id], related_ids
+    else:
+        actor_ids, movie_ids = related_ids, [instance.id]
+    invalidate_on_commit(
+        *[dependency('actor', pk) for pk in actor_ids],
+        *[dependency('movie', pk) for pk in movie_ids])
+
+
+@receiver(post_save, sender=Director)
+@receiver(post_delete, sender=Director)
+def director_changed(sender, instance, **kwargs):
+    invalidate_on_commit(dependency('director', instance.id),
+                         dependency('director-slug', instance.slugged_name))
+
+
+@receiver(post_save, sender=Actor)
+@receiver(post_delete, sender=Actor)
+def actor_changed(sender, instance, **kwargs):
+    invalidate_on_commit(dependency('actor', instance.id),
+                         dependency('actor-slug', instance.slugged_name))
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, instance, **kwargs):
+    invalidate_on_commit(dependency('movie', instance.movie_id))
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    # Also sent for cascade deletes, e.g. of the rating's owner
+    MovieRatingStats.rating_deleted(instance)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    invalidate_on_commit(dependency('reviews', instance.movie_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Director)
+@receiver(post_save, sender=Actor)
+def search_document_saved(sender, instance, **kwargs):
+    invalidate_on_commit('autocomplete', 'search')
+    for backend in get_backends():
+        transaction.on_commit(lambda backend=backend: backend.update(instance))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Director)
+@receiver(post_delete, sender=Actor)
+def search_document_deleted(sender, instance, **kwargs):
+    # Deleted instance has no pk by the time the transaction commits
+    pk = instance.pk
+    invalidate_on_commit('autocomplete', 'search')
+    for backend in get_backends():
+        transaction.on_commit(
+            lambda backend=backend: backend.remove(sender, pk))
@@ -0,0 +1,36 @@
+"""
+Cached map of movie slugs, current and historical, to the current slug.
+
+Detail pages consult it first, so an old slug is redirected and
+an unknown one is a 404 without querying the database again.
+"""
+from asgiref.sync import sync_to_async
+from movies import caching
+from movies.caching import dependency
+from movies.models import Movie, SlugHistory
+
+
+def build_current_slug(slug):
+    movie = Movie.objects.filter(slug=slug).values_list('id', 'slug').first()
+    if movie is None:
+        movie = SlugHistory.objects.filter(slug=slug).\
+            values_list('movie_id', 'movie__slug').first()
+    # movie-slug is bumped when a movie takes the slug or
+    # it is added to the history, movie when it is renamed
+    dependencies = [dependency('movie-slug', slug)]
+    if movie is None:
+        return None, dependencies
+    movie_id, current_slug = movie
+    return current_slug, dependencies + [dependency('movie', movie_id)]
+
+
+def get_current_slug(slug):
+    """Current slug of the movie known by slug, None if there is none."""
+    return caching.cached(f'movie-slug:{slug}',
+                          lambda: build_current_slug(slug), stats='slugs')
+
+
+async def aget_current_slug(slug):
+    return await caching.acached(
+        f'movie-slug:{slug}', sync_to_async(lambda: build_current_slug(slug)),
+        stats='slugs')
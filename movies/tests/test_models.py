@@ -1,7 +1,14 @@
 import tempfile
 from datetime import date
+from unittest import skipUnless
+from django.db import connection
+from django.db.models import Count
 from django.test import TestCase
-from movies.models import Director, Actor, Movie, Review, Rating
+from io import StringIO
+from django.core.management import call_command
+from movies.models import Director, Actor, Movie, Review, Rating, MovieRatingStats
+from movies.pagination import KeysetPaginator
+from movies.views import movie_reviews
 from users.models import CustomUser
 
 
@@ -194,3 +201,191 @@ class RatingModelTest(TestCase):
         rating = Rating.objects.get(owner__username='antonio')
         expected_object_str = rating.movie.title + ' ' + rating.owner.username
         self.assertEqual(str(rating), expected_object_str)
+
+
+class MovieRatingStatsModelTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(name="Quentin Tarantino",
+                                           photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        movie = Movie.objects.create(title='Pulp Fiction',
+                                     synopsis='Cool movie',
+                                     release_date=date(1994, 10, 14),
+                                     country='US',
+                                     poster=tempfile.NamedTemporaryFile(
+                                         suffix=".jpg").name,
+                                     director=director)
+        for id, value in enumerate([9, 9, 4], start=1):
+            user = CustomUser.objects.create_user(username=f'user{id}',
+                                                  email=f'user{id}@gmail.com',
+                                                  password='34somepassword34')
+            Rating.objects.create(movie=movie, owner=user, rating=value)
+
+    def test_rate_and_unrate_keep_sum_count_and_histogram(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        MovieRatingStats.rebuild()
+        MovieRatingStats.rate(movie, CustomUser.objects.get(username='user3'), 7)
+        stats = MovieRatingStats.unrate(movie, CustomUser.objects.get(username='user1'))
+        self.assertEqual(stats.rating_sum, 16)
+        self.assertEqual(stats.rating_count, 2)
+        self.assertEqual(stats.histogram[9], 1)
+        self.assertEqual(stats.histogram[7], 1)
+        self.assertEqual(stats.histogram[4], 0)
+        self.assertEqual(stats.avg_rating, 8)
+
+    def test_new_rating_without_stats_row_adds_to_ratings_table(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        user = CustomUser.objects.create_user(username='user4',
+                                              email='user4@gmail.com',
+                                              password='34somepassword34')
+        stats = MovieRatingStats.rate(movie, user, 4)
+        self.assertEqual(stats.rating_sum, 26)
+        self.assertEqual(stats.rating_count, 4)
+        self.assertEqual(stats.histogram[4], 2)
+
+    def test_deleting_user_takes_their_rating_out_of_stats(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        MovieRatingStats.rebuild()
+        CustomUser.objects.get(username='user3').delete()
+        stats = MovieRatingStats.objects.get(movie=movie)
+        self.assertEqual(stats.rating_count, 2)
+        self.assertEqual(stats.rating_sum, 18)
+        self.assertEqual(stats.histogram[4], 0)
+        self.assertEqual(stats.avg_rating, 9)
+
+    def test_unrate_takes_rating_out_of_stats_once(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        stats = MovieRatingStats.unrate(movie, CustomUser.objects.get(username='user3'))
+        self.assertEqual((stats.rating_sum, stats.rating_count), (18, 2))
+        stats.refresh_from_db()
+        self.assertEqual((stats.rating_sum, stats.rating_count), (18, 2))
+
+    def test_deleting_movie_deletes_its_stats(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        MovieRatingStats.rebuild()
+        movie.delete()
+        self.assertFalse(MovieRatingStats.objects.exists())
+
+    def test_change_updates_and_saves_stats(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        MovieRatingStats.rebuild()
+        stats = MovieRatingStats.objects.get(movie=movie)
+        stats.change(added=10, removed=9)
+        stats.refresh_from_db()
+        self.assertEqual(stats.rating_sum, 23)
+        self.assertEqual(stats.rating_count, 3)
+        self.assertEqual((stats.histogram[9], stats.histogram[10]), (1, 1))
+
+    def test_upsert_inserts_or_updates_and_returns_previous_rating(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        user = CustomUser.objects.get(username='user3')
+        self.assertEqual(Rating.objects.upsert(movie, user, 6), 4)
+        self.assertEqual(Rating.objects.get(movie=movie, owner=user).rating, 6)
+        new_user = CustomUser.objects.create_user(username='user4',
+                                                  email='user4@gmail.com',
+                                                  password='34somepassword34')
+        self.assertIsNone(Rating.objects.upsert(movie, new_user, 10))
+        self.assertEqual(Rating.objects.filter(movie=movie).count(), 4)
+
+    def test_rate_and_unrate_return_new_stats(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        MovieRatingStats.rebuild()
+        user = CustomUser.objects.get(username='user3')
+        stats = MovieRatingStats.rate(movie, user, 10)
+        self.assertEqual((stats.rating_sum, stats.rating_count), (28, 3))
+        # Rating twice replaces the first rating
+        stats = MovieRatingStats.rate(movie, user, 10)
+        self.assertEqual((stats.rating_sum, stats.rating_count), (28, 3))
+        self.assertEqual(stats.histogram[10], 1)
+        stats = MovieRatingStats.unrate(movie, user)
+        self.assertEqual((stats.rating_sum, stats.rating_count), (18, 2))
+        stats = MovieRatingStats.unrate(movie, user)
+        self.assertEqual((stats.rating_sum, stats.rating_count), (18, 2))
+        self.assertEqual(MovieRatingStats.objects.get(movie=movie).rating_count, 2)
+
+    def test_rate_without_stats_row_reads_ratings_table(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        user = CustomUser.objects.get(username='user1')
+        stats = MovieRatingStats.rate(movie, user, 1)
+        self.assertEqual((stats.rating_sum, stats.rating_count), (14, 3))
+
+    def test_rebuild_matches_ratings_table(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        MovieRatingStats.objects.create(movie=movie, rating_sum=1,
+                                        rating_count=1)
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        stats = MovieRatingStats.objects.get(movie=movie)
+        self.assertEqual(stats.rating_sum, 22)
+        self.assertEqual(stats.rating_count, 3)
+        self.assertEqual(stats.histogram[9], 2)
+        self.assertEqual(stats.histogram[4], 1)
+
+    def test_movie_queryset_reads_precomputed_average(self):
+        MovieRatingStats.rebuild()
+        movie = Movie.objects.with_rating_stats().get(title='Pulp Fiction')
+        self.assertAlmostEqual(movie.avg_rating, 22 / 3)
+        self.assertEqual(movie.number_of_ratings, 3)
+
+    def test_movie_without_ratings_has_no_average(self):
+        movie = Movie.objects.with_rating_stats().get(title='Pulp Fiction')
+        self.assertIsNone(movie.avg_rating)
+        self.assertEqual(movie.number_of_ratings, 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN output of PostgreSQL')
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = [CustomUser.objects.create_user(username=f'user{id}',
+                                                email=f'user{id}@gmail.com',
+                                                password='34somepassword34')
+                 for id in range(1, 6)]
+        for director_id in range(1, 4):
+            director = Director.objects.create(
+                name=f'Director {director_id}',
+                photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+            for movie_id in range(1, 11):
+                movie = Movie.objects.create(
+                    title=f'Movie {director_id}-{movie_id}',
+                    synopsis='Cool movie',
+                    release_date=date(1980 + movie_id, 10, 14),
+                    country='US',
+                    poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+                    director=director)
+                for user in users:
+                    Rating.objects.create(movie=movie, owner=user,
+                                          rating=movie_id % 11)
+                    Review.objects.create(movie=movie, owner=user,
+                                          content='Cool movie')
+        cls.director = director
+        cls.movie = movie
+
+    def explain(self, queryset):
+        # Tables are small enough for sequential scans to win, disabling
+        # them shows whether an index can serve the query at all
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_review_list_uses_movie_published_index(self):
+        paginator = KeysetPaginator(movie_reviews(self.movie), '-published', 10)
+        plan = self.explain(paginator.ordered(None)[:10])
+        self.assertIn('review_movie_published_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_director_page_uses_director_indexes(self):
+        movies = Movie.objects.filter(director=self.director).cards()
+        for ordering, index in [('title', 'movie_director_title_idx'),
+                                ('-release_date', 'movie_director_released_idx')]:
+            paginator = KeysetPaginator(movies, ordering, 10)
+            plan = self.explain(paginator.ordered(None)[:10])
+            self.assertIn(index, plan)
+            self.assertNotIn('Seq Scan', plan)
+
+    def test_rating_aggregate_uses_movie_rating_index(self):
+        # Same query as MovieRatingStats.aggregate_ratings
+        ratings = Rating.objects.filter(movie=self.movie).\
+            values('movie_id', 'rating').annotate(number=Count('*')).order_by()
+        plan = self.explain(ratings)
+        self.assertIn('rating_movie_rating_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
@@ -1,14 +1,34 @@
+import json
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection, DatabaseError
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, AsyncRequestFactory, \
+    override_settings
+from django.http import Http404
 from django.urls import reverse
 
 
-from movies.models import Movie, Director, Rating, Actor, Review
+from movies.models import Movie, Director, Rating, Actor, Review, MovieRatingStats, \
+    SlugHistory
+from movies import async_views, autocomplete, caching
 from movies.forms import RateMovieForm, ReviewMovieForm
+from movies.search import get_backend
+from movies.search import postgres
+from movies.search.postgres import has_trigram_support
+from cookie.throttling import SlidingWindow
 from users.models import CustomUser
+from cookie import routers
 from taggit.models import Tag, TaggedItem
 
 
@@ -44,6 +64,9 @@ class IndexViewTest(TestCase):
                 content_type=movie_content_type
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
@@ -68,6 +91,45 @@ class IndexViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['genres']), number_of_used_tags)
 
+    def test_tags_of_other_models_are_not_listed(self):
+        director = Director.objects.get(name='Quentin Tarantino')
+        TaggedItem.objects.create(
+            object_id=director.id,
+            tag=Tag.objects.get(name='Unused'),
+            content_type=ContentType.objects.get_for_model(Director)
+        )
+        response = self.client.get(reverse('movies:index'))
+        self.assertEqual(response.status_code, 200)
+        genre_names = [genre.name for genre in response.context['genres']]
+        self.assertFalse('Unused' in genre_names)
+
+    def test_number_of_movies_in_genre(self):
+        movie_content_type = ContentType.objects.get_for_model(Movie)
+        tag = Tag.objects.get(name='Tag 1')
+        TaggedItem.objects.create(object_id=Movie.objects.get(title='Movie 2').id,
+                                  tag=tag, content_type=movie_content_type)
+        response = self.client.get(reverse('movies:index'))
+        genres = {genre.name: genre.number_of_movies
+                  for genre in response.context['genres']}
+        self.assertEqual(genres['Tag 1'], 2)
+        self.assertEqual(genres['Tag 2'], 1)
+
+    def test_genres_are_cached_between_requests(self):
+        self.client.get(reverse('movies:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('movies:index'))
+        self.assertEqual(len(response.context['genres']), 5)
+
+    def test_cached_genres_are_invalidated_when_tags_change(self):
+        self.client.get(reverse('movies:index'))
+        TaggedItem.objects.create(
+            object_id=Movie.objects.get(title='Movie 1').id,
+            tag=Tag.objects.get(name='Unused'),
+            content_type=ContentType.objects.get_for_model(Movie)
+        )
+        response = self.client.get(reverse('movies:index'))
+        self.assertEqual(len(response.context['genres']), 6)
+
 
 class MoviesByGenreViewTest(TestCase):
     @classmethod
@@ -146,6 +208,9 @@ class MovieDetailViewTest(TestCase):
                                  suffix=".jpg").name,
                              director=director)
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         movie = Movie.objects.get(title='Pulp Fiction')
         response = self.client.get(f'/movies/{movie.slug}/')
@@ -198,6 +263,66 @@ class MovieDetailViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue('rating' in response.context)
 
+    def rename(self, movie, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.title = title
+            movie.save()
+
+    def test_old_slug_of_renamed_movie_redirects_permanently(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        self.client.get(reverse('movies:movie-detail', kwargs={'slug': 'pulp-fiction'}))
+        self.rename(movie, 'Pulp Fiction Redux')
+        self.rename(movie, 'Pulp Fiction Final Cut')
+        for slug in ['pulp-fiction', 'pulp-fiction-redux']:
+            response = self.client.get(
+                reverse('movies:movie-detail', kwargs={'slug': slug}))
+            self.assertRedirects(
+                response,
+                reverse('movies:movie-detail',
+                        kwargs={'slug': 'pulp-fiction-final-cut'}),
+                status_code=301)
+        self.assertEqual(SlugHistory.objects.filter(movie=movie).count(), 2)
+
+    def test_slug_taken_back_is_not_redirected(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        self.rename(movie, 'Pulp Fiction Redux')
+        self.client.get(reverse('movies:movie-detail', kwargs={'slug': 'pulp-fiction'}))
+        self.rename(movie, 'Pulp Fiction')
+        response = self.client.get(
+            reverse('movies:movie-detail', kwargs={'slug': 'pulp-fiction'}))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('movies:movie-detail', kwargs={'slug': 'pulp-fiction-redux'}))
+        self.assertEqual(response.status_code, 301)
+
+    def test_unknown_slug_is_served_from_cache(self):
+        url = reverse('movies:movie-detail', kwargs={'slug': 'no-such-movie'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_versions_of_unknown_slugs_expire(self):
+        url = reverse('movies:movie-detail', kwargs={'slug': 'crawled-slug'})
+        movies_cache = caching.get_cache()
+        with mock.patch.object(movies_cache, 'set_many',
+                               wraps=movies_cache.set_many) as set_many:
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertTrue(set_many.called)
+        for call in set_many.call_args_list:
+            self.assertEqual(call.args[1], 2 * settings.MOVIES_CACHE_TIMEOUT)
+
+    def test_versions_of_found_movies_do_not_expire(self):
+        movie = Movie.objects.get(title='Pulp Fiction')
+        url = reverse('movies:movie-detail', kwargs={'slug': movie.slug})
+        cache.clear()
+        movies_cache = caching.get_cache()
+        with mock.patch.object(movies_cache, 'set_many',
+                               wraps=movies_cache.set_many) as set_many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(set_many.called)
+        for call in set_many.call_args_list:
+            self.assertIsNone(call.args[1])
+
 
 class DirectorPageViewTest(TestCase):
     @classmethod
@@ -494,6 +619,23 @@ class RateMovieViewTest(TestCase):
         rating = Rating.objects.filter(owner__username='User2').first()
         self.assertTrue(rating is not None)
 
+    def test_rating_movie_updates_rating_stats(self):
+        movie = Movie.objects.get(title='Fight Club')
+        MovieRatingStats.rebuild()
+        login = self.client.login(username='User2',
+                                  password='34somepassword34')
+        self.client.post(
+            reverse('movies:rate-movie', kwargs={'pk': movie.id}),
+            data={'rating': 6})
+        stats = MovieRatingStats.objects.get(movie=movie)
+        self.assertEqual(stats.rating_count, 2)
+        self.assertEqual(stats.rating_sum, 15)
+        self.assertEqual(stats.histogram[6], 1)
+        response = self.client.get(
+            reverse('movies:movie-detail', kwargs={'slug': movie.slug}))
+        self.assertEqual(response.context['number_of_ratings'], 2)
+        self.assertEqual(response.context['movie'].avg_rating, 7.5)
+
 
 class UpdateRatingViewTest(TestCase):
     @classmethod
@@ -646,6 +788,21 @@ class UpdateRatingViewTest(TestCase):
         self.assertTrue(rating is not None)
         self.assertEqual(rating.rating, 10)
 
+    def test_updating_rating_updates_rating_stats(self):
+        movie = Movie.objects.get(title='Fight Club')
+        MovieRatingStats.rebuild()
+        previous_rating = Rating.objects.get(owner__username='User1').rating
+        login = self.client.login(username='User1',
+                                  password='34somepassword34')
+        self.client.post(
+            reverse('movies:rate-movie-update', kwargs={'pk': movie.id}),
+            data={'rating': 10})
+        stats = MovieRatingStats.objects.get(movie=movie)
+        self.assertEqual(stats.rating_count, 1)
+        self.assertEqual(stats.rating_sum, 10)
+        self.assertEqual(stats.histogram[10], 1)
+        self.assertEqual(stats.histogram[previous_rating], 0)
+
     def test_correct_response_for_nonexistent_movie(self):
         login = self.client.login(
             username='User1', password='34somepassword34')
@@ -716,6 +873,18 @@ class DeleteRatingViewTest(TestCase):
         rating = Rating.objects.filter(owner__username='User1').first()
         self.assertTrue(rating is None)
 
+    def test_deleting_rating_updates_rating_stats(self):
+        movie = Movie.objects.get(title='Fight Club')
+        MovieRatingStats.rebuild()
+        login = self.client.login(
+            username='User1', password='34somepassword34')
+        self.client.post(reverse('movies:rate-movie-delete',
+                                 kwargs={'pk': movie.id}))
+        stats = MovieRatingStats.objects.get(movie=movie)
+        self.assertEqual(stats.rating_count, 0)
+        self.assertEqual(stats.rating_sum, 0)
+        self.assertEqual(stats.histogram[8], 0)
+
     def test_correct_response_for_nonexistent_movie(self):
         login = self.client.login(
             username='User2', password='34somepassword34')
@@ -756,6 +925,9 @@ class ReviewListViewTest(TestCase):
         review_2 = Review.objects.create(
             owner=user_2, movie=movie, content=f'Review content {user_2.id}')
 
+    def setUp(self):
+        cache.clear()
+
     def test_correct_response_for_nonexistent_movie(self):
         response = self.client.get(reverse('movies:review-list',
                                            kwargs={'pk': 999}))
@@ -794,6 +966,107 @@ class ReviewListViewTest(TestCase):
         self.assertEqual(len(response.context['reviews_ratings']),
                          number_of_existing_reviews)
 
+    def test_reviews_have_ratings_of_their_owners(self):
+        movie = Movie.objects.get(title='Fight Club')
+        user_1 = CustomUser.objects.get(username='User1')
+        Rating.objects.create(owner=user_1, movie=movie, rating=0)
+        Rating.objects.create(owner=CustomUser.objects.get(username='User3'),
+                              movie=movie, rating=9)
+        response = self.client.get(reverse('movies:review-list',
+                                           kwargs={'pk': movie.id}))
+        ratings = {review.owner.username: review.owner_rating
+                   for review in response.context['reviews_ratings']}
+        self.assertEqual(ratings, {'User1': 0, 'User2': None})
+        self.assertContains(response, 'rated the movie as: <mark>0/10</mark>',
+                            html=False)
+
+    def test_number_of_queries_does_not_depend_on_number_of_reviews(self):
+        movie = Movie.objects.get(title='Fight Club')
+        for id in range(4, 14):
+            user = CustomUser.objects.create_user(username=f'User{id}',
+                                                  email=f'user{id}@gmail.com',
+                                                  password='34somepassword34')
+            Review.objects.create(owner=user, movie=movie, content='Content')
+            Rating.objects.create(owner=user, movie=movie, rating=id % 11)
+        # Movie, page of reviews with ratings and count of reviews
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('movies:review-list',
+                                               kwargs={'pk': movie.id}))
+        self.assertEqual(response.context['number_of_reviews'], 12)
+
+    @override_settings(REVIEWS_PER_PAGE=1)
+    def test_reviews_are_paginated(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:review-list', kwargs={'pk': movie.id})
+        response = self.client.get(url)
+        first_page = response.context['reviews_ratings']
+        self.assertEqual([r.content for r in first_page],
+                         [f"Review content {CustomUser.objects.get(username='User2').id}"])
+        self.assertEqual(response.context['number_of_reviews'], 2)
+        response = self.client.get(url, {'after': first_page.next_cursor})
+        second_page = response.context['reviews_ratings']
+        self.assertEqual([r.owner.username for r in second_page], ['User1'])
+        self.assertFalse(second_page.has_next)
+
+
+class ReviewListJsonViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        movie = Movie.objects.create(
+            title='Fight Club',
+            synopsis='Cool movie',
+            release_date=date(1999, 9, 10),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        for id in range(1, 6):
+            user = CustomUser.objects.create_user(username=f'User{id}',
+                                                  email=f'user{id}@gmail.com',
+                                                  password='34somepassword34')
+            Review.objects.create(owner=user, movie=movie,
+                                  content=f'Review content {id}')
+        Rating.objects.create(owner=CustomUser.objects.get(username='User1'),
+                              movie=movie, rating=8)
+
+    def get_json(self, **params):
+        movie = Movie.objects.get(title='Fight Club')
+        response = self.client.get(reverse('movies:review-list-json',
+                                           kwargs={'pk': movie.id}), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_view_streams_all_reviews_newest_first(self):
+        data = self.get_json()
+        self.assertEqual([review['owner'] for review in data['reviews']],
+                         ['User5', 'User4', 'User3', 'User2', 'User1'])
+        self.assertEqual(data['reviews'][-1]['rating'], 8)
+        self.assertEqual(data['reviews'][0]['rating'], None)
+        self.assertIsNone(data['next'])
+
+    def test_view_pages_through_reviews_with_cursor(self):
+        owners = []
+        data = self.get_json(limit=2)
+        while True:
+            owners += [review['owner'] for review in data['reviews']]
+            if not data['next']:
+                break
+            data = self.get_json(limit=2, after=data['next'])
+        self.assertEqual(owners, ['User5', 'User4', 'User3', 'User2', 'User1'])
+
+    def test_correct_response_for_invalid_parameters(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:review-list-json', kwargs={'pk': movie.id})
+        self.assertEqual(self.client.get(url, {'after': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'limit': 'ten'}).status_code, 400)
+        response = self.client.get(reverse('movies:review-list-json',
+                                           kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, 404)
+
 
 class ReviewMovieViewTest(TestCase):
     @classmethod
@@ -989,6 +1262,20 @@ class ReviewDetailViewTest(TestCase):
             rating=9
         )
 
+    def test_movie_rating_and_review_are_read_with_one_query(self):
+        movie = Movie.objects.get(title='Fight Club')
+        self.client.login(username='User2', password='34somepassword34')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('movies:review-detail',
+                                               kwargs={'pk': movie.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['review'].content, 'Movie is cool.')
+        self.assertEqual(response.context['rating'].rating, 9)
+        movie_queries = [query['sql'] for query in context.captured_queries
+                         if 'movies_' in query['sql']]
+        self.assertEqual(len(movie_queries), 1, '\n'.join(movie_queries))
+        self.assertNotIn('ORDER BY', movie_queries[0])
+
     def test_redirect_for_not_logged_user(self):
         response = self.client.get(reverse(
             'movies:review-detail', kwargs={'pk': 99}))
@@ -1200,6 +1487,9 @@ class SearchResultsViewTest(TestCase):
         actor = Actor.objects.create(name='Brad Pitt',
                                      photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
 
+    def setUp(self):
+        cache.clear()
+
     def test_correct_template_for_empty_search(self):
         response = self.client.get(reverse('movies:search') + '?query=')
         self.assertEqual(response.status_code, 200)
@@ -1258,3 +1548,792 @@ class SearchResultsViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(length_of_found_movies_list,
                          number_of_movies_with_title)
+
+    def test_view_finds_names_by_word_prefix(self):
+        response = self.client.get(reverse('movies:search'), {'q': 'fin'})
+        self.assertEqual(response.status_code, 200)
+        directors = response.context['results']['directors']
+        self.assertEqual([director.name for director in directors],
+                         ['David Fincher'])
+
+    def test_view_ranks_title_matches_above_synopsis_matches(self):
+        director = Director.objects.get(name='David Fincher')
+        Movie.objects.create(
+            title='Zodiac',
+            synopsis='A club of detectives hunts a killer',
+            release_date=date(2007, 3, 2),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        response = self.client.get(reverse('movies:search'), {'q': 'club'})
+        movies = response.context['results']['movies']
+        self.assertEqual([movie.title for movie in movies],
+                         ['Fight Club', 'Zodiac'])
+        self.assertEqual(response.context['counts']['movies'], 2)
+
+    def test_view_finds_movie_by_new_title_after_update(self):
+        movie = Movie.objects.get(title='Fight Club')
+        movie.title = 'Project Mayhem'
+        movie.save()
+        response = self.client.get(reverse('movies:search'), {'q': 'mayhem'})
+        self.assertEqual(len(response.context['results']['movies']), 1)
+
+    def test_results_are_cached_by_normalized_query(self):
+        self.client.get(reverse('movies:search'), {'q': 'Fight Club'})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('movies:search'),
+                                       {'q': '  fight   CLUB '})
+        self.assertEqual(len(response.context['results']['movies']), 1)
+        self.assertEqual(caching.get_stats('search')['hits'], 1)
+
+    def test_cached_results_are_invalidated_when_movies_change(self):
+        self.client.get(reverse('movies:search'), {'q': 'club'})
+        director = Director.objects.get(name='David Fincher')
+        Movie.objects.create(
+            title='Club Zero',
+            synopsis='Cool movie',
+            release_date=date(2023, 5, 22),
+            country='GB',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        response = self.client.get(reverse('movies:search'), {'q': 'club'})
+        self.assertEqual(response.context['counts']['movies'], 2)
+
+    @override_settings(SEARCH_RATE_LIMIT=2, SEARCH_RATE_LIMIT_WINDOW=200)
+    def test_view_limits_number_of_searches_per_client(self):
+        for query in ['fight', 'club']:
+            response = self.client.get(reverse('movies:search'), {'q': query})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('movies:search'), {'q': 'brad'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        self.assertEqual(
+            caching.get_counters('search', 'throttled')['throttled'], 1)
+        response = self.client.get(reverse('movies:search'), {'q': 'brad'},
+                                   REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SEARCH_RATE_LIMIT=1, SEARCH_RATE_LIMIT_WINDOW=0)
+    def test_view_is_not_limited_without_window(self):
+        for query in ['fight', 'club']:
+            response = self.client.get(reverse('movies:search'), {'q': query})
+            self.assertEqual(response.status_code, 200)
+
+    def test_concurrent_requests_cannot_all_pass(self):
+        window = SlidingWindow(cache, 'test:', 3, 200)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            waits = list(executor.map(lambda _: window.attempt('client'), range(8)))
+        self.assertEqual(waits.count(0), 3)
+
+    def test_view_finds_misspelled_names_with_trigrams(self):
+        if not has_trigram_support():
+            self.skipTest('pg_trgm extension is not available')
+        response = self.client.get(reverse('movies:search'), {'q': 'Finchre'})
+        directors = response.context['results']['directors']
+        self.assertEqual([director.name for director in directors],
+                         ['David Fincher'])
+
+    @override_settings(SEARCH_RESULTS_PER_SECTION=2)
+    def test_view_limits_results_per_section_and_counts_all(self):
+        for name in ['Brad Dourif', 'Brad Renfro']:
+            Actor.objects.create(name=name,
+                                 photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        response = self.client.get(reverse('movies:search'), {'q': 'brad'})
+        self.assertEqual(len(response.context['results']['actors']), 2)
+        self.assertEqual(response.context['counts']['actors'], 3)
+        self.assertEqual(response.context['number_of_results'], 3)
+
+
+@override_settings(SEARCH_BACKEND='movies.search.memory.InMemorySearchBackend')
+class SearchBackendsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        movie = Movie.objects.create(
+            title='Fight Club',
+            synopsis='Cool movie',
+            release_date=date(1999, 9, 10),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        movie.genres.add('Drama')
+        Actor.objects.create(name='Brad Pitt',
+                             photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+
+    def setUp(self):
+        cache.clear()
+        get_backend().reset()
+
+    def search(self, query):
+        response = self.client.get(reverse('movies:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.context['results'], response.context['counts']
+
+    def test_view_finds_objects_of_every_section(self):
+        results, counts = self.search('fi')
+        self.assertEqual([d.name for d in results['directors']], ['David Fincher'])
+        self.assertEqual([m.title for m in results['movies']], ['Fight Club'])
+        results, counts = self.search('dra')
+        self.assertEqual([g.slug for g in results['genres']], ['drama'])
+        results, counts = self.search('Brad Pitt')
+        self.assertEqual([a.slugged_name for a in results['actors']], ['brad-pitt'])
+
+    def test_view_finds_substrings_of_names(self):
+        results, counts = self.search('incher')
+        self.assertEqual(counts['directors'], 1)
+        results, counts = self.search('xyz')
+        self.assertEqual(sum(counts.values()), 0)
+
+    def test_view_ranks_prefix_matches_first(self):
+        Actor.objects.create(name='Pitt Brad',
+                             photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        Actor.objects.create(name='Kenneth Branagh',
+                             photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        results, counts = self.search('bra')
+        self.assertEqual([a.name for a in results['actors']],
+                         ['Brad Pitt', 'Kenneth Branagh', 'Pitt Brad'])
+
+    @override_settings(SEARCH_RESULTS_PER_SECTION=1)
+    def test_view_limits_results_per_section_and_counts_all(self):
+        Actor.objects.create(name='Brad Renfro',
+                             photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        results, counts = self.search('brad')
+        self.assertEqual(len(results['actors']), 1)
+        self.assertEqual(counts['actors'], 2)
+
+    def test_index_is_updated_by_signals(self):
+        self.search('club')
+        movie = Movie.objects.get(title='Fight Club')
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.title = 'Project Mayhem'
+            movie.save()
+        with self.assertNumQueries(0):
+            results, counts = get_backend().search('mayhem', 10)
+        self.assertEqual([m.slug for m in results['movies']], [movie.slug])
+        self.assertEqual(get_backend().search('club', 10)[1]['movies'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Actor.objects.get(name='Brad Pitt').delete()
+        self.assertEqual(get_backend().search('brad', 10)[1]['actors'], 0)
+
+    @override_settings(
+        SEARCH_BACKEND='movies.search.postgres.PostgresSearchBackend',
+        SEARCH_FALLBACK_BACKEND='movies.search.memory.InMemorySearchBackend')
+    def test_fallback_backend_is_used_on_database_error(self):
+        get_backend(settings.SEARCH_FALLBACK_BACKEND).reset()
+        with mock.patch('movies.search.postgres.PostgresSearchBackend.search',
+                        side_effect=DatabaseError):
+            results, counts = self.search('fincher')
+        self.assertEqual(counts['directors'], 1)
+
+
+@override_settings(AUTOCOMPLETE_REBUILD_IN_BACKGROUND=False)
+class SearchAutocompleteViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        movie = Movie.objects.create(
+            title='Fight Club',
+            synopsis='Cool movie',
+            release_date=date(1999, 9, 10),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        movie.genres.add('Drama')
+        Actor.objects.create(name='Brad Pitt',
+                             photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+
+    def setUp(self):
+        cache.clear()
+
+    def complete(self, query):
+        response = self.client.get(reverse('movies:search-autocomplete'),
+                                   {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_view_returns_prefix_matches_of_every_type(self):
+        self.assertEqual(self.complete('f'), [
+            {'type': 'movie', 'label': 'Fight Club',
+             'url': reverse('movies:movie-detail', args=('fight-club', ))},
+            {'type': 'director', 'label': 'David Fincher',
+             'url': reverse('movies:director-page', args=('david-fincher', ))},
+        ])
+        self.assertEqual([r['type'] for r in self.complete('dra')], ['genre'])
+        self.assertEqual([r['label'] for r in self.complete('brad p')],
+                         ['Brad Pitt'])
+
+    def test_view_matches_beginnings_of_words_only(self):
+        self.assertEqual(self.complete('pitt')[0]['label'], 'Brad Pitt')
+        self.assertEqual(self.complete('itt'), [])
+        self.assertEqual(self.complete(''), [])
+
+    @override_settings(AUTOCOMPLETE_RESULTS=2)
+    def test_view_limits_number_of_results(self):
+        for name in ['Brad Dourif', 'Brad Renfro']:
+            Actor.objects.create(name=name,
+                                 photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        self.assertEqual([r['label'] for r in self.complete('brad')],
+                         ['Brad Dourif', 'Brad Pitt'])
+
+    def test_index_is_built_once_and_rebuilt_after_changes(self):
+        self.complete('fi')
+        with self.assertNumQueries(0):
+            self.complete('fi')
+        Movie.objects.filter(title='Fight Club').get().delete()
+        self.assertEqual([r['label'] for r in self.complete('fi')],
+                         ['David Fincher'])
+
+    @override_settings(AUTOCOMPLETE_REBUILD_IN_BACKGROUND=True)
+    def test_old_index_is_served_while_rebuilt_in_background(self):
+        built = threading.Event()
+
+        def build_entries():
+            built.wait(5)
+            return [('fincher', 0, 'director', 'David Fincher', '/fincher/')]
+
+        with mock.patch.object(autocomplete, '_index',
+                               {'version': None, 'keys': [], 'entries': []}):
+            # The first index is built by the request
+            self.assertEqual(len(self.complete('fi')), 2)
+            caching.invalidate('autocomplete')
+            with mock.patch('movies.autocomplete.build_entries', build_entries):
+                with self.assertNumQueries(0):
+                    self.assertEqual(len(self.complete('fi')), 2)
+                built.set()
+                # Released by the rebuild thread when it is done
+                with autocomplete._rebuilding:
+                    pass
+            self.assertEqual(self.complete('fi'), [
+                {'type': 'director', 'label': 'David Fincher', 'url': '/fincher/'}])
+
+
+@override_settings(SEARCH_CONCURRENT_SECTIONS=True, SEARCH_SECTION_TIMEOUT=1)
+class ConcurrentSearchSectionsTest(TransactionTestCase):
+    # Sections run in other threads with their own connections,
+    # which cannot see data of a TestCase transaction
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Worker threads would otherwise keep their connections
+        # open and the test database could not be dropped
+        cls.conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection.settings_dict['CONN_MAX_AGE'] = 0
+
+    @classmethod
+    def tearDownClass(cls):
+        connection.settings_dict['CONN_MAX_AGE'] = cls.conn_max_age
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        Movie.objects.create(
+            title='Fight Club',
+            synopsis='Cool movie',
+            release_date=date(1999, 9, 10),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        Actor.objects.create(name='Fiona Shaw',
+                             photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+
+    def test_sections_are_searched_concurrently(self):
+        response = self.client.get(reverse('movies:search'), {'q': 'fi'})
+        counts = response.context['counts']
+        self.assertEqual((counts['actors'], counts['directors'], counts['movies']),
+                         (1, 1, 1))
+        self.assertFalse(response.context['incomplete'])
+
+    def test_slow_section_is_left_out_of_results(self):
+        search_section = postgres.search_section
+
+        def slow_actors(queryset, *args):
+            if queryset.model is Actor:
+                time.sleep(1.5)
+                return [], 0
+            return search_section(queryset, *args)
+
+        with mock.patch('movies.search.postgres.search_section',
+                        side_effect=slow_actors), \
+                self.assertLogs('movies.search.postgres', 'WARNING'):
+            response = self.client.get(reverse('movies:search'), {'q': 'fi'})
+        self.assertIsNone(response.context['counts']['actors'])
+        self.assertEqual(response.context['counts']['movies'], 1)
+        self.assertEqual(response.context['number_of_results'], 2)
+        self.assertContains(response, 'Search took too long')
+        # Incomplete results are not cached
+        self.assertEqual(
+            caching.get_stats('search'), {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+        response = self.client.get(reverse('movies:search'), {'q': 'fi'})
+        self.assertEqual(response.context['counts']['actors'], 1)
+
+    def test_queued_sections_are_not_left_out_under_load(self):
+        busy = ThreadPoolExecutor(max_workers=1)
+        released = threading.Event()
+        # Other searches keep the only worker busy for longer than the timeout
+        busy.submit(released.wait, 5)
+        try:
+            with mock.patch('movies.search.postgres.get_executor',
+                            return_value=busy):
+                response = self.client.get(reverse('movies:search'), {'q': 'fi'})
+        finally:
+            released.set()
+            busy.shutdown()
+        counts = response.context['counts']
+        self.assertEqual((counts['actors'], counts['directors'], counts['movies']),
+                         (1, 1, 1))
+        self.assertFalse(response.context['incomplete'])
+
+
+class MoviePagesCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        actor = Actor.objects.create(
+            name='Brad Pitt',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        movie = Movie.objects.create(
+            title='Fight Club',
+            synopsis='Cool movie',
+            release_date=date(1999, 9, 10),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(
+                    suffix=".jpg").name,
+            director=director,
+        )
+        movie.actors.add(actor)
+        movie.genres.add('Drama')
+        CustomUser.objects.create_user(username='User1',
+                                       email='user1@gmail.com',
+                                       password='34somepassword34')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_movie_detail_is_served_from_cache(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:movie-detail', kwargs={'slug': movie.slug})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        stats = caching.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_movie_detail_is_invalidated_when_movie_changes(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:movie-detail', kwargs={'slug': movie.slug})
+        self.client.get(url)
+        movie.synopsis = 'Changed synopsis'
+        movie.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['movie'].synopsis, 'Changed synopsis')
+
+    def test_shared_part_of_movie_detail_changes_with_actors(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:movie-detail', kwargs={'slug': movie.slug})
+        self.client.get(url)
+        actor = Actor.objects.get(name='Brad Pitt')
+        actor.name = 'William Bradley Pitt'
+        actor.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'William Bradley Pitt')
+
+    def test_rating_box_of_movie_detail_is_rendered_per_user(self):
+        movie = Movie.objects.get(title='Fight Club')
+        user = CustomUser.objects.get(username='User1')
+        Rating.objects.create(movie=movie, owner=user, rating=8)
+        url = reverse('movies:movie-detail', kwargs={'slug': movie.slug})
+        response = self.client.get(url)
+        self.assertContains(response, 'Rate this movie')
+        self.client.login(username='User1', password='34somepassword34')
+        response = self.client.get(url)
+        self.assertContains(response, 'Your rating of the movie')
+        self.assertNotContains(response, 'Rate this movie')
+
+    def test_director_page_is_invalidated_when_director_changes(self):
+        director = Director.objects.get(name='David Fincher')
+        url = reverse('movies:director-page',
+                      kwargs={'slug': director.slugged_name})
+        self.client.get(url)
+        director.photo = tempfile.NamedTemporaryFile(suffix=".png").name
+        director.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['director'].photo, director.photo)
+
+    def test_genre_page_is_invalidated_when_movie_is_rated(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:genre-movies', kwargs={'slug': 'drama'})
+        response = self.client.get(url)
+        self.assertIsNone(response.context['movies'][0].avg_rating)
+        self.client.login(username='User1', password='34somepassword34')
+        self.client.post(reverse('movies:rate-movie', kwargs={'pk': movie.id}),
+                         data={'rating': 7})
+        response = self.client.get(url)
+        self.assertEqual(response.context['movies'][0].avg_rating, 7)
+
+    def test_actor_page_is_invalidated_when_actors_of_movie_change(self):
+        actor = Actor.objects.get(name='Brad Pitt')
+        url = reverse('movies:actor-page', kwargs={'slug': actor.slugged_name})
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['movies']), 1)
+        Movie.objects.get(title='Fight Club').actors.remove(actor)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['movies']), 0)
+
+    def test_genre_page_is_invalidated_when_movie_is_tagged(self):
+        url = reverse('movies:genre-movies', kwargs={'slug': 'drama'})
+        self.client.get(url)
+        director = Director.objects.get(name='David Fincher')
+        movie = Movie.objects.create(
+            title='Zodiac',
+            synopsis='Cool movie',
+            release_date=date(2007, 3, 2),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        movie.genres.add('Drama')
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['movies']), 2)
+
+    def test_value_built_during_a_change_is_not_stored(self):
+        dependencies = [caching.dependency('movie', 1)]
+
+        def build():
+            value = 'old synopsis'
+            # A writer commits and bumps while the old row is in hand
+            caching.invalidate(*dependencies)
+            return value, dependencies
+
+        self.assertEqual(caching.cached('test-entry', build), 'old synopsis')
+        self.assertFalse(caching.lookup('test-entry')[0])
+        caching.cached('test-entry', lambda: ('new synopsis', dependencies))
+        self.assertEqual(caching.lookup('test-entry')[:2], (True, 'new synopsis'))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp()}})
+    def test_cache_works_with_file_backend(self):
+        movie = Movie.objects.get(title='Fight Club')
+        url = reverse('movies:movie-detail', kwargs={'slug': movie.slug})
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(caching.get_stats()['hits'], 1)
+        movie.synopsis = 'Changed synopsis'
+        movie.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['movie'].synopsis, 'Changed synopsis')
+
+
+class MaxQueriesMixin:
+    def assertMaxQueries(self, max_queries, url):
+        # Measures a cold request, so the database path is what is counted
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(context), max_queries,
+            '\n'.join(query['sql'] for query in context.captured_queries))
+
+
+class ListingPagesQueriesTest(MaxQueriesMixin, TestCase):
+    max_queries = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        cls.actor = Actor.objects.create(
+            name='Brad Pitt',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+
+    def add_movies(self, number_of_movies):
+        for id in range(1, number_of_movies+1):
+            movie = Movie.objects.create(
+                title=f'Movie {number_of_movies} {id}',
+                synopsis='Cool movie',
+                release_date=date(1990, 10, 14),
+                country='US',
+                poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+                director=self.director,
+            )
+            movie.actors.add(self.actor)
+            movie.genres.add('Drama', f'Genre {id}')
+
+    def assertListingQueries(self, url):
+        self.add_movies(1)
+        self.assertMaxQueries(self.max_queries, url)
+        self.add_movies(15)
+        self.assertMaxQueries(self.max_queries, url)
+
+    def test_genre_page_queries_do_not_grow_with_movies(self):
+        self.assertListingQueries(
+            reverse('movies:genre-movies', kwargs={'slug': 'drama'}))
+
+    def test_director_page_queries_do_not_grow_with_movies(self):
+        self.assertListingQueries(
+            reverse('movies:director-page',
+                    kwargs={'slug': self.director.slugged_name}))
+
+    def test_actor_page_queries_do_not_grow_with_movies(self):
+        self.assertListingQueries(
+            reverse('movies:actor-page',
+                    kwargs={'slug': self.actor.slugged_name}))
+
+    def test_movie_detail_queries_do_not_grow_with_cast(self):
+        self.add_movies(1)
+        movie = Movie.objects.get(title='Movie 1 1')
+        for id in range(10):
+            movie.actors.add(Actor.objects.create(
+                name=f'Actor {id}',
+                photo=tempfile.NamedTemporaryFile(suffix=".jpg").name))
+        self.assertMaxQueries(
+            self.max_queries,
+            reverse('movies:movie-detail', kwargs={'slug': movie.slug}))
+
+
+@override_settings(MOVIES_PER_PAGE=2)
+class MovieListPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        for id, year in enumerate([1999, 2007, 1995, 2010, 2002], start=1):
+            movie = Movie.objects.create(
+                title=f'Movie {id}',
+                synopsis='Cool movie',
+                release_date=date(year, 1, 1),
+                country='US',
+                poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+                director=director,
+            )
+            movie.genres.add('Drama')
+
+    def setUp(self):
+        cache.clear()
+
+    def walk_pages(self, url, sort):
+        titles = []
+        response = self.client.get(url, {'sort': sort})
+        while True:
+            titles += [movie.title for movie in response.context['movies']]
+            page = response.context['page']
+            if not page.has_next:
+                return titles, response
+            response = self.client.get(url, {'sort': sort,
+                                              'after': page.next_cursor})
+
+    def test_pages_cover_all_movies_by_title(self):
+        url = reverse('movies:genre-movies', kwargs={'slug': 'drama'})
+        titles, response = self.walk_pages(url, 'title')
+        self.assertEqual(titles, [f'Movie {id}' for id in range(1, 6)])
+        self.assertEqual(response.context['number_of_movies'], 5)
+
+    def test_pages_cover_all_movies_by_release_date(self):
+        director = Director.objects.get(name='David Fincher')
+        url = reverse('movies:director-page',
+                      kwargs={'slug': director.slugged_name})
+        titles, response = self.walk_pages(url, 'release_date')
+        self.assertEqual(titles, ['Movie 4', 'Movie 2', 'Movie 5',
+                                  'Movie 1', 'Movie 3'])
+
+    def test_previous_page(self):
+        url = reverse('movies:genre-movies', kwargs={'slug': 'drama'})
+        first_page = self.client.get(url).context['page']
+        second_page = self.client.get(
+            url, {'after': first_page.next_cursor}).context['page']
+        response = self.client.get(
+            url, {'before': second_page.previous_cursor})
+        self.assertEqual([movie.title for movie in response.context['movies']],
+                         ['Movie 1', 'Movie 2'])
+        self.assertFalse(response.context['page'].has_previous)
+
+    def test_pages_are_read_without_offset(self):
+        url = reverse('movies:genre-movies', kwargs={'slug': 'drama'})
+        first_page = self.client.get(url).context['page']
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {'after': first_page.next_cursor})
+        for query in context.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_invalid_cursor(self):
+        url = reverse('movies:genre-movies', kwargs={'slug': 'drama'})
+        response = self.client.get(url, {'after': 'not a cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ReadOnlyAsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(
+            name='David Fincher',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        actor = Actor.objects.create(
+            name='Brad Pitt',
+            photo=tempfile.NamedTemporaryFile(suffix=".jpg").name)
+        movie = Movie.objects.create(
+            title='Fight Club',
+            synopsis='Cool movie',
+            release_date=date(1999, 9, 10),
+            country='US',
+            poster=tempfile.NamedTemporaryFile(suffix=".jpg").name,
+            director=director,
+        )
+        movie.actors.add(actor)
+        movie.genres.add('Thriller')
+        cls.user = CustomUser.objects.create_user(username='User1',
+                                                  email='user1@gmail.com',
+                                                  password='34somepassword34')
+        Rating.objects.create(owner=cls.user, movie=movie, rating=7)
+
+    def setUp(self):
+        cache.clear()
+
+    async def get(self, view, path, user=None, **kwargs):
+        request = AsyncRequestFactory().get(path)
+        request.user = user or AnonymousUser()
+        return await view.as_view()(request, **kwargs)
+
+    async def test_async_pages_render_movie(self):
+        pages = [
+            (async_views.IndexView, reverse('movies:index'), {}),
+            (async_views.MovieDetailView, '/', {'slug': 'fight-club'}),
+            (async_views.MoviesByGenreListView, '/', {'slug': 'thriller'}),
+            (async_views.DirectorPageView, '/', {'slug': 'david-fincher'}),
+            (async_views.ActorPageView, '/', {'slug': 'brad-pitt'}),
+            (async_views.SearchResultsView, '/search/?q=fight', {}),
+        ]
+        for view, path, kwargs in pages:
+            response = await self.get(view, path, **kwargs)
+            self.assertEqual(response.status_code, 200, view)
+            expected = 'Thriller' if view is async_views.IndexView else 'Fight Club'
+            self.assertContains(response, expected)
+
+    async def test_async_detail_page_shows_users_rating(self):
+        response = await self.get(async_views.MovieDetailView, '/',
+                                  user=self.user, slug='fight-club')
+        self.assertContains(response, '7')
+
+    async def test_async_pages_raise_404_for_unknown_objects(self):
+        for view in [async_views.MovieDetailView, async_views.ActorPageView,
+                     async_views.DirectorPageView,
+                     async_views.MoviesByGenreListView]:
+            with self.assertRaises(Http404):
+                await self.get(view, '/', slug='unknown')
+
+    async def test_async_detail_page_redirects_old_slug(self):
+        await SlugHistory.objects.acreate(
+            slug='fight-club-1999', movie=await Movie.objects.aget(slug='fight-club'))
+        response = await self.get(async_views.MovieDetailView, '/',
+                                  slug='fight-club-1999')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response.url, reverse('movies:movie-detail',
+                                               kwargs={'slug': 'fight-club'}))
+
+    def test_async_views_share_cache_with_sync_views(self):
+        async_to_sync(self.get)(async_views.MovieDetailView, '/',
+                                slug='fight-club')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('movies:movie-detail',
+                                               kwargs={'slug': 'fight-club'}))
+        self.assertEqual(response.status_code, 200)
+
+
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.replicas = []
+        self.router_db_for_read = routers.ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            # Record the choice, but read from the test database
+            self.replicas.append(routers._replica.get())
+            return 'default'
+
+        patches = [
+            mock.patch('cookie.routers.replica_aliases', return_value=['replica1']),
+            mock.patch.object(routers.ReplicaRouter, 'db_for_read', db_for_read),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_read_only_view_reads_from_replica(self):
+        response = self.client.get(reverse('movies:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.replicas)
+        self.assertEqual(set(self.replicas), {'replica1'})
+        self.assertIsNone(routers._replica.get())
+
+    def test_other_views_read_from_primary(self):
+        self.client.get(reverse('movies:review-list-json', kwargs={'pk': 1}))
+        self.client.post(reverse('movies:rate-movie', kwargs={'pk': 1}))
+        self.assertTrue(self.replicas)
+        self.assertEqual(set(self.replicas), {None})
+
+    def test_client_reads_from_primary_after_write(self):
+        response = self.client.post(reverse('users:login'),
+                                    data={'email': 'nobody@gmail.com',
+                                          'password': 'secret'})
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[settings.REPLICA_PIN_COOKIE]['max-age'],
+                         settings.REPLICA_PIN_SECONDS)
+        self.replicas.clear()
+        self.client.get(reverse('movies:index'))
+        self.assertTrue(self.replicas)
+        self.assertEqual(set(self.replicas), {None})
+
+    def test_no_pin_cookie_without_replicas(self):
+        with mock.patch('cookie.routers.replica_aliases', return_value=[]):
+            response = self.client.post(reverse('users:login'),
+                                        data={'email': 'nobody@gmail.com',
+                                              'password': 'secret'})
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_recently_changed_page_read_from_replica_is_not_cached(self):
+        url = reverse('movies:index')
+        # Versions are set, but just now
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(caching.get_stats()['hits'], 0)
+        later = time.time_ns() + (settings.REPLICA_PIN_SECONDS + 1) * 10 ** 9
+        with mock.patch('movies.caching.time.time_ns', return_value=later):
+            self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(caching.get_stats()['hits'], 1)
+
+    def test_recently_changed_page_read_from_primary_is_cached(self):
+        url = reverse('movies:index')
+        with mock.patch('cookie.routers.replica_aliases', return_value=[]):
+            self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(caching.get_stats()['hits'], 1)
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(self.router_db_for_read(router, Movie), 'default')
+        routers.read_from_replica()
+        try:
+            self.assertEqual(self.router_db_for_read(router, Movie), 'replica1')
+            self.assertEqual(router.db_for_write(Movie), 'default')
+        finally:
+            routers.read_from_primary()
+        self.assertEqual(self.router_db_for_read(router, Movie), 'default')
@@ -0,0 +1,16 @@
+from cookie.throttling import SlidingWindow
+from movies import caching
+
+THROTTLE_PREFIX = 'movies:throttle:'
+
+
+def client_id(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def search_window(limit, window):
+    """Searches allowed per client, kept in the movies cache."""
+    return SlidingWindow(caching.get_cache(), f'{THROTTLE_PREFIX}search:',
+                         limit, window)
@@ -1,61 +1,146 @@
+import json
 from typing import Any, Dict, Optional
 from django import http
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from django.db.models import Avg, Count
+from django.db.models import FilteredRelation
 from django.db.models.query_utils import Q
 from django.db.models.query import QuerySet
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponseRedirect, HttpResponsePermanentRedirect, \
+    Http404, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.shortcuts import render
 from django.views.generic import ListView, DetailView, View
-from taggit.models import Tag, TaggedItem
-from movies.models import Movie, Director, Actor, Rating, Review
+from taggit.models import Tag
+from movies.models import Movie, Director, Actor, Rating, Review, MovieRatingStats
 from movies.forms import RateMovieForm, ReviewMovieForm
+from movies import autocomplete, caching
+from movies.caching import dependency
+from movies.genres import get_genre_index
+from movies.pagination import KeysetPaginator
+from movies.search import search
+from movies.slugs import get_current_slug
+from movies.throttling import client_id, search_window
 
 
 class IndexView(ListView):
+    replica_reads = True
     template_name = 'movies/index.html'
     context_object_name = 'genres'
 
     def get_queryset(self):
-        tagged_items_ids = [t.tag_id for t in TaggedItem.objects.all()]
-        return Tag.objects.filter(id__in=tagged_items_ids)\
-            .order_by('name').all().annotate(number_of_movies=Count('taggit_taggeditem_items'))
-
-
-class MoviesByGenreListView(ListView):
+        return get_genre_index()
+
+
+def movie_dependencies(movies):
+    dependencies = []
+    for movie in movies:
+        dependencies.append(dependency('movie', movie.id))
+        dependencies.append(dependency('director', movie.director_id))
+    return dependencies
+
+
+class MovieListPageMixin:
+    orderings = {
+        'title': 'title',
+        'release_date': '-release_date'
+    }
+
+    def get_movies_page(self, movies, cache_key, dependencies):
+        sort = self.request.GET.get('sort')
+        if sort not in self.orderings:
+            sort = 'title'
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        per_page = settings.MOVIES_PER_PAGE
+        paginator = KeysetPaginator(movies.cards(), self.orderings[sort],
+                                    per_page)
+
+        def build_page():
+            page = paginator.get_page(after=after, before=before)
+            return page, dependencies + movie_dependencies(page)
+
+        page = caching.cached(
+            f'{cache_key}:{sort}:{per_page}:{after}:{before}', build_page)
+        # Counted once per change of the list instead of on every page
+        number_of_movies = caching.cached(
+            f'{cache_key}:count', lambda: (movies.count(), dependencies))
+        return {'movies': page, 'page': page, 'sort': sort,
+                'number_of_movies': number_of_movies}
+
+
+class MoviesByGenreListView(MovieListPageMixin, ListView):
+    replica_reads = True
     template_name = 'movies/movies_by_genre.html'
     context_object_name = 'movies'
 
     def get_queryset(self) -> QuerySet[Any]:
         genre_slug = self.kwargs['slug']
+        self.genre = caching.cached(f'genre:{genre_slug}',
+                                    lambda: self.build_genre(genre_slug))
+        self.movies_page = self.get_movies_page(
+            Movie.objects.filter(genres=self.genre),
+            f'genre-movies:{self.genre.id}',
+            [dependency('genre', self.genre.id)]
+        )
+        return self.movies_page['movies']
+
+    def build_genre(self, genre_slug):
         genre = Tag.objects.filter(slug=genre_slug).first()
         if not genre:
             raise Http404
-        self.genre = genre
-        movies = Movie.objects.filter(genres=genre).\
-            select_related('director').all().annotate(
-            avg_rating=Avg('ratings__rating')
-        )
-        return movies
+        return genre, [dependency('genre', genre.id),
+                       dependency('genre-slug', genre_slug)]
 
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
+        context.update(self.movies_page)
         context['genre'] = self.genre
         return context
 
 
 class MovieDetailView(DetailView):
+    replica_reads = True
     model = Movie
     queryset = Movie.objects.select_related('director').\
-        all().annotate(avg_rating=Avg('ratings__rating'))
+        with_actors().with_genres().with_rating_stats()
     template_name = 'movies/movie_detail.html'
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
 
+    def get(self, request, *args, **kwargs):
+        slug = self.kwargs[self.slug_url_kwarg]
+        current_slug = get_current_slug(slug)
+        if current_slug is None:
+            raise Http404
+        if current_slug != slug:
+            # The movie was renamed
+            return HttpResponsePermanentRedirect(
+                reverse('movies:movie-detail', kwargs={'slug': current_slug}))
+        return super().get(request, *args, **kwargs)
+
+    def get_object(self, queryset=None):
+        slug = self.kwargs[self.slug_url_kwarg]
+        return caching.cached(f'movie-detail:{slug}',
+                              lambda: self.build_object(queryset, slug))
+
+    def build_object(self, queryset, slug):
+        movie = super().get_object(queryset)
+        dependencies = [dependency('movie-slug', slug)]
+        dependencies += movie_dependencies([movie])
+        dependencies += [dependency('actor', actor.id)
+                         for actor in movie.actors.all()]
+        dependencies += [dependency('genre', genre.id)
+                         for genre in movie.genres.all()]
+        # Keys the shared template fragment, changes together
+        # with any of the objects the page is built from
+        movie.cache_version = caching.version_token(dependencies)
+        return movie, dependencies
+
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         current_user = self.request.user
         context = super().get_context_data(**kwargs)
@@ -71,48 +156,113 @@ class MovieDetailView(DetailView):
                 context['rating'] = None
         else:
             context['rating'] = None
-        context['number_of_ratings'] = Rating.objects.\
-            filter(movie__slug=self.kwargs['slug']).all().count()
+        context['number_of_ratings'] = self.object.number_of_ratings
+        context['cache_timeout'] = settings.MOVIES_CACHE_TIMEOUT
         return context
 
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
 
 
-class DirectorPageView(View):
+class DirectorPageView(MovieListPageMixin, View):
+    replica_reads = True
     template_name = 'movies/director_page.html'
 
     def get(self, request, *args, **kwargs):
         director_slugged_name = self.kwargs['slug']
+        director = caching.cached(
+            f'director:{director_slugged_name}',
+            lambda: self.build_director(director_slugged_name)
+        )
+        context = self.get_movies_page(
+            Movie.objects.filter(director=director),
+            f'director-movies:{director.id}',
+            [dependency('director', director.id)]
+        )
+        context['director'] = director
+        return render(request, self.template_name, context)
+
+    def build_director(self, director_slugged_name):
         director = Director.objects.filter(
             slugged_name=director_slugged_name).first()
         if not director:
             raise Http404
-        movies = Movie.objects.select_related('director').\
-            filter(director=director).all().order_by('title').\
-            annotate(avg_rating=Avg('ratings__rating'))
-        return render(request, self.template_name, {'movies': movies,
-                                                    'director': director})
+        return director, [dependency('director', director.id),
+                          dependency('director-slug', director_slugged_name)]
 
 
-class ActorPageView(View):
+class ActorPageView(MovieListPageMixin, View):
+    replica_reads = True
     template_name = 'movies/actor_page.html'
 
     def get(self, request, *args, **kwargs):
         actor_slugged_name = self.kwargs['slug']
+        actor = caching.cached(
+            f'actor:{actor_slugged_name}',
+            lambda: self.build_actor(actor_slugged_name)
+        )
+        context = self.get_movies_page(
+            Movie.objects.filter(actors=actor),
+            f'actor-movies:{actor.id}',
+            [dependency('actor', actor.id)]
+        )
+        context['actor'] = actor
+        return render(request, self.template_name, context)
+
+    def build_actor(self, actor_slugged_name):
         actor = Actor.objects.filter(
             slugged_name=actor_slugged_name
         ).first()
         if not actor:
             raise Http404
-        movies = Movie.objects.select_related('director').\
-            filter(actors=actor).all().order_by('title').\
-            annotate(avg_rating=Avg('ratings__rating'))
-        return render(request, self.template_name, {'movies': movies,
-                                                    'actor': actor})
+        return actor, [dependency('actor', actor.id),
+                       dependency('actor-slug', actor_slugged_name)]
 
 
-class RateMovieView(View):
+class MovieUserObjectsMixin:
+    """
+    Movie from the URL with the current user's rating and review of it,
+    read with one query and kept on the request, so the checks and the
+    write of a view do not look them up again.
+    """
+
+    def get_movie(self, pk):
+        movies = self.request.__dict__.setdefault('_movies_with_user_objects', {})
+        if pk not in movies:
+            movies[pk] = self.load_movie(pk)
+        return movies[pk]
+
+    def load_movie(self, pk):
+        user = self.request.user
+        movies = Movie.objects.filter(id=pk)
+        if user.is_authenticated:
+            # Both are unique per (movie, owner), so at most one row
+            movies = movies.annotate(
+                user_rating=FilteredRelation(
+                    'ratings', condition=Q(ratings__owner_id=user.id)),
+                user_review=FilteredRelation(
+                    'reviews', condition=Q(reviews__owner_id=user.id)),
+            ).select_related('user_rating', 'user_review')
+        # Slicing instead of first() avoids ORDER BY
+        movie = next(iter(movies[:1]), None)
+        if movie is None:
+            return None
+        # Missing rows leave the attributes unset
+        movie.user_rating = getattr(movie, 'user_rating', None)
+        movie.user_review = getattr(movie, 'user_review', None)
+        for obj in (movie.user_rating, movie.user_review):
+            if obj is not None:
+                obj.movie = movie
+        return movie
+
+    def get_rating(self, movie):
+        return movie.user_rating
+
+    def get_review(self, movie):
+        return movie.user_review
+
+
+class RateMovieView(MovieUserObjectsMixin, View):
     form_class = RateMovieForm
     template_name = 'movies/rate_movie.html'
     info_message = 'Please, authenticate to rate a movie'
@@ -120,16 +270,6 @@ class RateMovieView(View):
     redirect_to = 'movies:movie-detail'
     success_message = 'You successfully rated this movie'
 
-    def get_movie(self, pk):
-        return Movie.objects.filter(id=pk).first()
-
-    def rating_exists(self, movie_pk, user):
-        return Rating.objects.\
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
     def get(self, request, *args, **kwargs):
         current_user = self.request.user
         movie_pk = self.kwargs['pk']
@@ -141,7 +281,7 @@ class RateMovieView(View):
                 request, self.info_message
             )
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
-        if self.rating_exists(movie.id, current_user):
+        if self.get_rating(movie):
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
         form = self.form_class()
@@ -158,43 +298,34 @@ class RateMovieView(View):
                 request, self.info_message
             )
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
-        if self.rating_exists(movie.id, current_user):
+        if self.get_rating(movie):
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
         form = self.form_class(request.POST)
         if form.is_valid():
-            form.instance.movie = movie
-            form.instance.owner = current_user
-            form.save()
+            # A concurrent double submit updates the rating
+            # instead of failing on the unique constraint
+            MovieRatingStats.rate(movie, current_user,
+                                  form.cleaned_data['rating'])
             messages.success(request, self.success_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
         return render(request, self.template_name, {'form': form,
                                                     'movie': movie})
 
 
-class UpdateRatingView(View):
+class UpdateRatingView(MovieUserObjectsMixin, View):
     template_name = 'movies/update_rating.html'
     form_class = RateMovieForm
     redirect_to = 'movies:movie-detail'
     warning_message = 'You have no rating on this movie to update'
     success_message = 'You successfully updated your rating of the movie'
 
-    def get_movie(self, pk):
-        return Movie.objects.filter(id=pk).first()
-
-    def get_rating(self, movie_pk, user):
-        return Rating.objects.\
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
     def get(self, request, *args, **kwargs):
         current_user = self.request.user
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
             raise Http404
-        rating = self.get_rating(movie.id, current_user)
+        rating = self.get_rating(movie)
         if not rating:
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
@@ -207,13 +338,14 @@ class UpdateRatingView(View):
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
             raise Http404
-        rating = self.get_rating(movie.id, current_user)
+        rating = self.get_rating(movie)
         if not rating:
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
         form = self.form_class(request.POST, instance=rating)
         if form.is_valid():
-            form.save()
+            MovieRatingStats.rate(movie, current_user,
+                                  form.cleaned_data['rating'])
             messages.success(request, self.success_message)
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.slug, )
@@ -226,33 +358,23 @@ class UpdateRatingView(View):
         return super().dispatch(request, *args, **kwargs)
 
 
-class DeleteRatingView(View):
+class DeleteRatingView(MovieUserObjectsMixin, View):
     redirect_to = 'movies:movie-detail'
     warning_message = 'You have no rating on the movie to delete.'
     success_message = 'You successfully deleted your rating on the movie.'
 
-    def get_movie(self, pk):
-        return Movie.objects.filter(id=pk).first()
-
-    def get_rating(self, movie_pk, user):
-        return Rating.objects.\
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
     def post(self, request, *args, **kwargs):
         current_user = self.request.user
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
             raise Http404
-        rating = self.get_rating(movie.id, current_user)
+        rating = self.get_rating(movie)
         if not rating:
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.slug, )
             ))
-        rating.delete()
+        MovieRatingStats.unrate(movie, current_user)
         messages.success(request, self.success_message)
         return HttpResponseRedirect(reverse(self.redirect_to, args=(movie.slug, )))
 
@@ -261,7 +383,13 @@ class DeleteRatingView(View):
         return super().dispatch(request, *args, **kwargs)
 
 
+def movie_reviews(movie):
+    return Review.objects.filter(movie=movie).\
+        select_related('owner').with_owner_rating()
+
+
 class ReviewListView(View):
+    replica_reads = True
     template_name = 'movies/review_list.html'
 
     def get_movie(self, pk):
@@ -271,33 +399,73 @@ class ReviewListView(View):
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
             raise Http404
-        reviews_ratings = []
-        reviews = list(Review.objects.select_related('owner').
-                       filter(movie__id=movie.id).all().order_by('-published'))
-        reviews_owner_ids = [review.owner.id for review in reviews]
-        ratings = list(Rating.objects.
-                       filter(
-                           Q(movie__id=movie.id) &
-                           Q(owner__id__in=reviews_owner_ids)
-                       ).all())
-        ratings_owner_ids = [rating.owner.id for rating in ratings]
-        for review in reviews:
-            if review.owner.id in ratings_owner_ids:
-                rating_index = ratings_owner_ids.index(review.owner.id)
-                rating = ratings[rating_index]
-                reviews_ratings.append([review, rating])
-            else:
-                reviews_ratings.append([review, None])
-        if self.request.user.is_authenticated and (self.request.user.id in reviews_owner_ids):
-            user_has_review = True
-        else:
-            user_has_review = False
-        return render(request, self.template_name, {'reviews_ratings': reviews_ratings,
+        reviews = movie_reviews(movie)
+        paginator = KeysetPaginator(reviews, '-published',
+                                    settings.REVIEWS_PER_PAGE)
+        page = paginator.get_page(after=request.GET.get('after'),
+                                  before=request.GET.get('before'))
+        number_of_reviews = caching.cached(
+            f'review-count:{movie.id}',
+            lambda: (reviews.count(), [dependency('reviews', movie.id)]))
+        user_has_review = request.user.is_authenticated and \
+            reviews.filter(owner=request.user).exists()
+        return render(request, self.template_name, {'reviews_ratings': page,
+                                                    'page': page,
+                                                    'number_of_reviews': number_of_reviews,
                                                     'user_has_review': user_has_review,
                                                     'movie': movie})
 
 
-class ReviewMovieView(View):
+class ReviewListJsonView(View):
+    """
+    Reviews of the movie as JSON, newest first, starting after the
+    'after' cursor. Without 'limit' all remaining reviews are streamed,
+    read from a server-side cursor in chunks, so memory use does not
+    grow with the number of reviews.
+    """
+
+    def get(self, request, *args, **kwargs):
+        movie = Movie.objects.filter(id=self.kwargs['pk']).only('id').first()
+        if not movie:
+            raise Http404
+        try:
+            limit = int(request.GET.get('limit', 0))
+        except ValueError:
+            return JsonResponse({'error': 'limit must be a number'}, status=400)
+        paginator = KeysetPaginator(movie_reviews(movie), '-published', limit)
+        reviews = paginator.ordered(request.GET.get('after'))
+        if limit > 0:
+            reviews = reviews[:limit]
+        return StreamingHttpResponse(self.stream(paginator, reviews, limit),
+                                     content_type='application/json')
+
+    def stream(self, paginator, reviews, limit):
+        yield '{"reviews": ['
+        last_review = None
+        number_of_reviews = 0
+        for review in reviews.iterator(chunk_size=settings.REVIEWS_STREAM_CHUNK_SIZE):
+            separator = ', ' if last_review else ''
+            yield separator + json.dumps(self.serialize(review), cls=DjangoJSONEncoder)
+            last_review = review
+            number_of_reviews += 1
+        # A full page may be followed by more reviews
+        next_cursor = None
+        if limit > 0 and number_of_reviews == limit:
+            next_cursor = paginator.encode_cursor(last_review)
+        yield '], "next": ' + json.dumps(next_cursor) + '}'
+
+    def serialize(self, review):
+        return {
+            'id': review.id,
+            'owner': review.owner.username,
+            'rating': review.owner_rating,
+            'content': review.content,
+            'published': review.published,
+            'updated': review.updated,
+        }
+
+
+class ReviewMovieView(MovieUserObjectsMixin, View):
     template_name = 'movies/review_movie.html'
     redirect_to = 'movies:review-list'
     success_message = 'You successfully published your review on the movie'
@@ -305,16 +473,6 @@ class ReviewMovieView(View):
     info_message = 'Please, authenticate to publish your review on the movie'
     form_class = ReviewMovieForm
 
-    def get_movie(self, pk):
-        return Movie.objects.filter(id=pk).first()
-
-    def review_exists(self, movie_pk, user):
-        return Review.objects.\
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
     def get(self, request, *args, **kwargs):
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
@@ -325,7 +483,7 @@ class ReviewMovieView(View):
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.id, )
             ))
-        if self.review_exists(movie.id, current_user):
+        if self.get_review(movie):
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.id, )
@@ -344,7 +502,7 @@ class ReviewMovieView(View):
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.id, )
             ))
-        if self.review_exists(movie.id, current_user):
+        if self.get_review(movie):
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.id, )
@@ -360,42 +518,25 @@ class ReviewMovieView(View):
                                                     'movie': movie})
 
 
-class ReviewDetailView(View):
+class ReviewDetailView(MovieUserObjectsMixin, View):
     template_name = 'movies/review_detail.html'
     form_class = ReviewMovieForm
     success_message = 'You successfully updated your review of the movie.'
     warning_message = 'You have not reviewed the movie.'
     redirect_to = 'movies:review-list'
 
-    def get_movie(self, pk):
-        return Movie.objects.filter(id=pk).first()
-
-    def get_rating(self, movie_pk, user):
-        return Rating.objects. \
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
-    def get_review(self, movie_pk, user):
-        return Review.objects.\
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
     def get(self, request, *args, **kwargs):
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
             raise Http404
         current_user = self.request.user
-        review = self.get_review(movie.id, current_user)
+        review = self.get_review(movie)
         if not review:
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.id, )
             ))
-        rating = self.get_rating(movie.id, current_user)
+        rating = self.get_rating(movie)
         form = self.form_class(instance=review)
         return render(request, self.template_name, {'movie': movie,
                                                     'review': review,
@@ -407,13 +548,13 @@ class ReviewDetailView(View):
         if not movie:
             raise Http404
         current_user = request.user
-        review = self.get_review(movie.id, current_user)
+        review = self.get_review(movie)
         if not review:
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(
                 self.redirect_to, args=(movie.id, )
             ))
-        rating = self.get_rating(movie.id, current_user)
+        rating = self.get_rating(movie)
         form = self.form_class(request.POST, instance=review)
         if form.is_valid():
             form.save()
@@ -429,27 +570,17 @@ class ReviewDetailView(View):
         return super().dispatch(request, *args, **kwargs)
 
 
-class DeleteReviewView(View):
+class DeleteReviewView(MovieUserObjectsMixin, View):
     redirect_to = 'movies:review-list'
     success_message = 'You successfully deleted your review of the movie.'
     warning_message = 'You have no review of the movie to delete.'
 
-    def get_movie(self, pk):
-        return Movie.objects.filter(id=pk).first()
-
-    def get_review(self, movie_pk, user):
-        return Review.objects.\
-            filter(
-                Q(owner=user) &
-                Q(movie__id=movie_pk)
-            ).first()
-
     def post(self, request, *args, **kwargs):
         movie = self.get_movie(self.kwargs['pk'])
         if not movie:
             raise Http404
         current_user = self.request.user
-        review = self.get_review(movie.id, current_user)
+        review = self.get_review(movie)
         if not review:
             messages.warning(request, self.warning_message)
             return HttpResponseRedirect(reverse(
@@ -465,37 +596,41 @@ class DeleteReviewView(View):
 
 
 class SearchResultsView(View):
+    replica_reads = True
     template_name = 'movies/search_results.html'
 
+    def get_window(self):
+        return search_window(settings.SEARCH_RATE_LIMIT,
+                             settings.SEARCH_RATE_LIMIT_WINDOW)
+
     def get(self, request, *args, **kwargs):
-        results = {
-            'actors': [],
-            'directors': [],
-            'movies': []
-        }
         query = self.request.GET.get('q')
         if query:
-            actors = Actor.objects.filter(
-                Q(name__icontains=query)
-            ).order_by('name').all()
-            results['actors'] = actors
-            ####################################
-            directors = Director.objects.filter(
-                Q(name__icontains=query)
-            ).order_by('name').all()
-            results['directors'] = directors
-            #####################################
-            movies = Movie.objects.filter(
-                Q(title__icontains=query)
-            ).all().order_by('title')
-            results['movies'] = movies
-            number_of_results = len(
-                results['actors']) + len(results['directors']) + len(results['movies'])
+            retry_after = self.get_window().attempt(client_id(request))
+            if retry_after:
+                caching.count('search', 'throttled')
+                response = render(request, 'errors/429.html', status=429)
+                response['Retry-After'] = str(int(retry_after) + 1)
+                return response
+            results, counts = search(query)
+            number_of_results = sum(count or 0 for count in counts.values())
             return render(request, self.template_name, {'results': results,
+                                                        'counts': counts,
                                                         'query': query,
-                                                        'number_of_results': number_of_results})
+                                                        'number_of_results': number_of_results,
+                                                        'incomplete': None in counts.values()})
         return render(request, 'movies/empty_search.html')
 
 
+class AutocompleteView(View):
+    replica_reads = True
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '')
+        limit = settings.AUTOCOMPLETE_RESULTS
+        results = autocomplete.complete(query[:100], limit)
+        return JsonResponse({'query': query, 'results': results})
+
+
 def error_404_handler(request, exception):
     return render(request, 'errors/404.html', status=404)
@@ -1,25 +1,112 @@
+import time
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password
+from django.core.cache import caches
+from django.db.models.functions import Lower
+from cookie.routers import PRIMARY
+from users.hashers import needs_rehash, schedule_rehash
 from users.models import CustomUser
 
+USER_CACHE_PREFIX = 'users:user:'
+# Changed when a user is saved or deleted, a cached user stored
+# with an other version of the user is not used
+USER_VERSION_PREFIX = 'users:version:'
+# Changed when users are updated in bulk, cached users
+# stored with an other generation are not used
+GENERATION_KEY = 'users:generation'
+
+
+def get_cache():
+    return caches[settings.USERS_CACHE_ALIAS]
+
+
+def forget_user(user_id):
+    """Drop the cached user, done by users.signals when a user changes."""
+    get_cache().set(f'{USER_VERSION_PREFIX}{user_id}', time.time_ns(), None)
+
+
+def forget_all_users():
+    """Drop all cached users, done by CustomUser.objects.update()."""
+    get_cache().set(GENERATION_KEY, time.time_ns(), None)
+
+
+def get_versions(cache, user_id, found=None):
+    """
+    Current (generation, version) the cached user_id must be stored with,
+    found may hold them already, read together with the cached user.
+    """
+    keys = [GENERATION_KEY, f'{USER_VERSION_PREFIX}{user_id}']
+    found = dict(found) if found is not None else cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Never set or evicted, a new value so no entry cached before is used
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
 
 class EmailAuthBackend(ModelBackend):
+    """
+    The only authentication backend, users log in with their email
+    or username. Every attempt hashes the password exactly once.
+    """
 
     def authenticate(self, request, username=None, password=None, *args, **kwargs):
         UserModel = get_user_model()
-
-        try:
-            user = UserModel.objects.get(email=username)
-        except UserModel.DoesNotExist:
+        if username is None or password is None:
+            return None
+        user = None
+        if '@' in username:
+            # Matches the lower(email) unique index, a single index probe
+            user = UserModel.objects.alias(email_lower=Lower('email')).\
+                filter(email_lower=username.lower()).first()
+        if user is None:
+            # Usernames may contain '@' too
+            user = UserModel.objects.filter(username=username).first()
+        if user is None:
+            # Hash anyway, so unknown users cannot be told apart by timing
+            UserModel().set_password(password)
             return None
-        else:
-            if user.check_password(password):
-                return user
-        return None
+        # Without a setter, an outdated hash is not replaced during
+        # the request, which would hash the password a second time
+        if not check_password(password, user.password) \
+                or not self.user_can_authenticate(user):
+            return None
+        if needs_rehash(user.password):
+            schedule_rehash(user, password)
+        return user
 
-    def get_user(self, user_id):
+    def load_user(self, user_id):
+        # Always from the primary, a replica may still have the
+        # password hash or is_active from before a change
         UserModel = get_user_model()
         try:
-            return UserModel.objects.get(pk=user_id)
+            return UserModel._default_manager.using(PRIMARY).get(pk=user_id)
         except UserModel.DoesNotExist:
             return None
+
+    def get_user(self, user_id):
+        # Runs on every request of a logged in user. The cached user
+        # carries its password hash, so sessions are still ended by
+        # a password change, as saves change the user's version and
+        # bulk updates the generation
+        if not settings.USERS_CACHE_TIMEOUT:
+            user = self.load_user(user_id)
+            return user if user and self.user_can_authenticate(user) else None
+        cache = get_cache()
+        key = f'{USER_CACHE_PREFIX}{user_id}'
+        found = cache.get_many([GENERATION_KEY, f'{USER_VERSION_PREFIX}{user_id}', key])
+        versions = get_versions(cache, user_id, found)
+        cached_versions, user = found.get(key, (None, None))
+        if cached_versions != versions:
+            user = self.load_user(user_id)
+            if user is None:
+                return None
+            # Versions are read before the user, so if the user changed
+            # after it was read, the versions differ by now and the old
+            # row is not stored
+            if get_versions(cache, user_id) == versions:
+                cache.set(key, (versions, user), settings.USERS_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
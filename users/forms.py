@@ -57,7 +57,7 @@ class EmailLoginForm(AuthenticationForm):
         super().__init__(*args, **kwargs)
         self.fields['username'].label = 'Email'
         self.error_messages = {
-            'invalid_login': "Please enter a correct email and password. Note that both fields may be case-sensitive.",
+            'invalid_login': "Please enter a correct email and password. Note that the password is case-sensitive.",
             'inactive': "This account is inactive.",
         }
         # self.fields['password'].widget.attrs['placeholder'] = 'Password'
@@ -0,0 +1,115 @@
+"""
+Password hashers with cost taken from settings, see PASSWORD_HASHER
+in cookie/settings.py, and rehashing of outdated hashes after login.
+
+The algorithm names are Django's own, so hashes made by Django's
+hashers are verified as usual and rehashed when the cost changes.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from users.models import CustomUser
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+
+def needs_rehash(encoded):
+    """Whether a valid hash should be replaced by one of the preferred hasher."""
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = hashers.get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix='rehash')
+    return _executor
+
+
+def session_hash(encoded):
+    # Same HMAC as AbstractBaseUser.get_session_auth_hash() of the hash
+    return salted_hmac(
+        'django.contrib.auth.models.AbstractBaseUser.get_session_auth_hash',
+        encoded, algorithm='sha256').hexdigest()
+
+
+def rehash(user_id, encoded, raw_password):
+    new_encoded = hashers.make_password(raw_password)
+    with transaction.atomic():
+        # Skipped if the password was changed in the meantime
+        user = CustomUser.objects.select_for_update().\
+            filter(pk=user_id, password=encoded).first()
+        if user is not None:
+            user.password = new_encoded
+            # Only the session hash of the old, weaker password hash is
+            # kept, until sessions started before the rehash have expired
+            user.previous_session_hash = session_hash(encoded)
+            user.previous_session_hash_expires = timezone.now() + \
+                timedelta(seconds=settings.SESSION_COOKIE_AGE)
+            user.save(update_fields=['password', 'previous_session_hash',
+                                     'previous_session_hash_expires'])
+
+
+def forget_expired_session_hashes():
+    """Clear session hashes of replaced password hashes that have expired."""
+    return CustomUser.objects.\
+        filter(previous_session_hash_expires__lte=timezone.now()).\
+        update(previous_session_hash='', previous_session_hash_expires=None)
+
+
+def rehash_in_background(*args):
+    # The worker thread has its own connection, closed
+    # or kept like request connections
+    close_old_connections()
+    try:
+        rehash(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule_rehash(user, raw_password):
+    """
+    Replace user's password hash after the current transaction, in a
+    background thread when PASSWORD_REHASH_IN_BACKGROUND is set, so
+    the login request pays for one hash only.
+    """
+    args = (user.pk, user.password, raw_password)
+    if settings.PASSWORD_REHASH_IN_BACKGROUND:
+        transaction.on_commit(
+            lambda: get_executor().submit(rehash_in_background, *args))
+    else:
+        transaction.on_commit(lambda: rehash(*args))
@@ -0,0 +1,52 @@
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.forms import EmailLoginForm
+from users.models import CustomUser
+
+PASSWORD = '34benchpassword34'
+
+
+class Command(BaseCommand):
+    help = 'Measures CPU time of login attempts, as run by the login view, ' \
+        'next to the cost of hashing one password. ' \
+        'A temporary user is created and rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=20,
+                            help='Attempts per case')
+
+    def measure(self, attempt, number):
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        for _ in range(number):
+            attempt()
+        cpu = (time.process_time() - start_cpu) * 1000 / number
+        wall = (time.perf_counter() - start) * 1000 / number
+        return cpu, wall
+
+    def login(self, username, password):
+        def attempt():
+            EmailLoginForm(data={'username': username,
+                                 'password': password}).is_valid()
+        return attempt
+
+    def handle(self, *args, **options):
+        number = options['attempts']
+        with transaction.atomic():
+            CustomUser.objects.create_user(username='bench_login_user',
+                                           email='bench_login@example.com',
+                                           password=PASSWORD)
+            cases = [
+                ('one hash', lambda: make_password(PASSWORD)),
+                ('email', self.login('Bench_Login@example.com', PASSWORD)),
+                ('username', self.login('bench_login_user', PASSWORD)),
+                ('wrong password', self.login('bench_login@example.com', 'wrong')),
+                ('unknown user', self.login('nobody@example.com', PASSWORD)),
+            ]
+            for name, attempt in cases:
+                cpu, wall = self.measure(attempt, number)
+                self.stdout.write(f'{name:<15} cpu: {cpu:8.2f} ms   '
+                                  f'wall: {wall:8.2f} ms')
+            transaction.set_rollback(True)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from users.hashers import forget_expired_session_hashes
+
+
+class Command(BaseCommand):
+    help = 'Clears session hashes of replaced password hashes once sessions ' \
+        'started before the rehash have expired, run it like clearsessions'
+
+    def handle(self, *args, **options):
+        cleared = forget_expired_session_hashes()
+        self.stdout.write(f'cleared: {cleared}')
@@ -0,0 +1,41 @@
+from collections import Counter
+from django.contrib.auth.hashers import get_hasher, identify_hasher, \
+    UNUSABLE_PASSWORD_PREFIX
+from django.core.management.base import BaseCommand
+from users.hashers import needs_rehash
+from users.models import CustomUser
+
+# Parts of a decoded hash that are not cost parameters
+NOT_PARAMETERS = ('algorithm', 'hash', 'salt')
+
+
+class Command(BaseCommand):
+    help = 'Shows how many users have password hashes of each algorithm ' \
+        'and cost, and how many will be rehashed on their next login'
+
+    def describe(self, encoded):
+        if not encoded or encoded.startswith(UNUSABLE_PASSWORD_PREFIX):
+            return 'unusable'
+        try:
+            hasher = identify_hasher(encoded)
+        except ValueError:
+            return 'unknown'
+        decoded = hasher.decode(encoded)
+        parameters = ', '.join(f'{name}={value}'
+                               for name, value in sorted(decoded.items())
+                               if name not in NOT_PARAMETERS)
+        return f'{hasher.algorithm} ({parameters})' if parameters \
+            else hasher.algorithm
+
+    def handle(self, *args, **options):
+        hashes = Counter()
+        outdated = 0
+        passwords = CustomUser.objects.values_list('password', flat=True)
+        for encoded in passwords.iterator():
+            hashes[self.describe(encoded)] += 1
+            outdated += needs_rehash(encoded)
+        total = sum(hashes.values())
+        self.stdout.write(f'preferred hasher: {get_hasher().algorithm}')
+        for description, number in hashes.most_common():
+            self.stdout.write(f'  {description}: {number} ({number / total:.1%})')
+        self.stdout.write(f'users: {total}, rehashed on next login: {outdated}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from users import throttling
+
+
+class Command(BaseCommand):
+    help = 'Shows how many login and registration attempts were made ' \
+        'and how many of them were throttled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset counters after showing them')
+
+    def handle(self, *args, **options):
+        for action in throttling.ACTIONS:
+            counters = throttling.get_counters(action)
+            attempts = counters['attempts']
+            throttled = counters['throttled']
+            self.stdout.write(f'{action}:')
+            self.stdout.write(f'  attempts: {attempts}')
+            self.stdout.write(f'  throttled: {throttled}')
+            if attempts:
+                self.stdout.write(f'  throttled rate: {throttled / attempts:.2%}')
+        if options['reset']:
+            for action in throttling.ACTIONS:
+                throttling.reset_counters(action)
+            self.stdout.write(self.style.SUCCESS('Counters were reset'))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:56
+
+from django.db import migrations, models
+import django.db.models.functions.text
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    # Fails on the constraint below if two users share an email
+    # in different case, those have to be merged by hand first
+    CustomUser = apps.get_model('users', 'CustomUser')
+    CustomUser.objects.exclude(email=Lower('email')).update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_remove_customuser_image'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='users_customuser_email_lower_uniq', violation_error_message='A user with this email already exists.'),
+        ),
+    ]
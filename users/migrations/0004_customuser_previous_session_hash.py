@@ -0,0 +1,23 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_email_lower'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='previous_session_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='previous_session_hash_expires',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.core.exceptions import ValidationError
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.utils import timezone
+from django.db import models, transaction
+from django.db.models.functions import Lower
 
 
 def validate_file_size(file):
@@ -14,5 +16,54 @@ def validate_file_size(file):
         raise ValidationError(f'Files cannot be larger than {max_kb_size}KB')
 
 
+class CustomUserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Sends no post_save, so users.signals cannot drop single users
+        from users.authentication import forget_all_users
+        rows = super().update(**kwargs)
+        transaction.on_commit(forget_all_users, using=self.db)
+        return rows
+
+    update.alters_data = True
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    pass
+
+
 class CustomUser(AbstractUser):
-    email = models.EmailField(unique=True)
+    # Stored in lower case, looked up through the lower(email)
+    # unique index by users.authentication.EmailAuthBackend
+    email = models.EmailField()
+    # Session hash of the password hash replaced by users.hashers.rehash,
+    # sessions started before the rehash are valid until it expires.
+    # The old password hash itself is not kept
+    previous_session_hash = models.CharField(max_length=64, blank=True,
+                                             editable=False)
+    previous_session_hash_expires = models.DateTimeField(null=True, blank=True,
+                                                         editable=False)
+
+    objects = CustomUserManager()
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                Lower('email'), name='users_customuser_email_lower_uniq',
+                violation_error_message='A user with this email already exists.'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.email = self.email.lower()
+        super().save(*args, **kwargs)
+
+    def set_password(self, raw_password):
+        # A new password ends sessions made with any previous hash
+        super().set_password(raw_password)
+        self.previous_session_hash = ''
+        self.previous_session_hash_expires = None
+
+    def get_session_auth_fallback_hash(self):
+        yield from super().get_session_auth_fallback_hash()
+        if self.previous_session_hash and self.previous_session_hash_expires \
+                and self.previous_session_hash_expires > timezone.now():
+            yield self.previous_session_hash
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.authentication import forget_user
+from users.models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    # After commit, a request that read the old row before the commit
+    # sees the new version when it is about to cache the row, and does
+    # not store it (see EmailAuthBackend.get_user)
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_user(user_id))
@@ -1,6 +1,7 @@
 from django.test import TestCase
 
 from users.forms import EmailLoginForm, UserCreationForm, UserChangeForm
+from users.models import CustomUser
 
 
 class EmailLoginFormTest(TestCase):
@@ -19,6 +20,19 @@ class UserCreationFormTest(TestCase):
         self.assertEqual(help_text, 'Required. Enter a valid email address.')
 
 
+    def test_email_taken_in_other_case_is_rejected(self):
+        CustomUser.objects.create_user(username='antonio',
+                                       email='antonio@gmail.com',
+                                       password='34somepassword34')
+        form = UserCreationForm(data={'username': 'antonio2',
+                                      'email': 'Antonio@Gmail.com',
+                                      'password1': '34password34',
+                                      'password2': '34password34'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('A user with this email already exists.',
+                      form.non_field_errors())
+
+
 class UserChangeFormTest(TestCase):
 
     def test_email_help_text(self):
@@ -1,3 +1,7 @@
+from io import StringIO
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.test import TestCase
 
 from users.models import CustomUser
@@ -14,3 +18,26 @@ class CustomUserModelTest(TestCase):
         user = CustomUser.objects.get(username='antonio')
         field_label = user._meta.get_field('email').verbose_name
         self.assertEqual(field_label, 'email')
+
+    def test_email_is_stored_in_lower_case(self):
+        user = CustomUser.objects.create_user(username='antonio2',
+                                              email='Antonio.Two@Gmail.com',
+                                              password='34somepassword34')
+        user.refresh_from_db()
+        self.assertEqual(user.email, 'antonio.two@gmail.com')
+
+    def test_email_is_unique_ignoring_case(self):
+        with self.assertRaises(IntegrityError):
+            CustomUser.objects.bulk_create([
+                CustomUser(username='antonio2', email='ANTONIO@gmail.com')])
+
+    def test_password_hash_report(self):
+        CustomUser.objects.create_user(username='antonio2',
+                                       email='antonio2@gmail.com')
+        CustomUser.objects.filter(username='antonio').update(
+            password=make_password('34somepassword34', hasher='pbkdf2_sha256'))
+        out = StringIO()
+        call_command('password_hash_report', stdout=out)
+        self.assertIn('pbkdf2_sha256 (iterations=', out.getvalue())
+        self.assertIn('unusable: 1 (50.0%)', out.getvalue())
+        self.assertIn('users: 2, rehashed on next login: 1', out.getvalue())
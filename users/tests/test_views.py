@@ -1,13 +1,25 @@
+import warnings
+from unittest import mock
 from django.contrib import auth
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.core.cache import cache, CacheKeyWarning
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
+from cookie import routers
+from cookie.throttling import SlidingWindow
+from users import throttling
+from users.authentication import EmailAuthBackend, GENERATION_KEY, forget_user
+from users.hashers import forget_expired_session_hashes, session_hash
 from users.models import CustomUser
 from users.forms import UserCreationForm, EmailLoginForm, UserChangeForm
 
 
 class RegisterUserViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
 
     def test_view_uses_correct_template(self):
         response = self.client.get(reverse('users:register'))
@@ -72,6 +84,9 @@ class LoginUserViewTest(TestCase):
                                                    password='34somepassword34',
                                                    email='someone@gmail.com')
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_uses_correct_template(self):
         response = self.client.get(reverse('users:login'))
         self.assertEqual(response.status_code, 200)
@@ -103,6 +118,50 @@ class LoginUserViewTest(TestCase):
         self.assertTrue(response.wsgi_request.user.is_authenticated)
 
 
+    def test_login_attempts_hash_password_once(self):
+        attempts = [('someone@gmail.com', '34somepassword34'),
+                    ('some_user', '34somepassword34'),
+                    ('someone@gmail.com', 'wrongpassword123'),
+                    ('nobody@gmail.com', '34somepassword34')]
+        hasher = type(get_hasher())
+        for username, password in attempts:
+            with mock.patch.object(hasher, 'encode', autospec=True,
+                                   side_effect=hasher.encode) as encode:
+                self.client.post(reverse('users:login'),
+                                 data={'username': username, 'password': password})
+            self.assertEqual(encode.call_count, 1, username)
+            self.client.logout()
+
+    def test_login_with_email_in_other_case(self):
+        response = self.client.post(reverse('users:login'),
+                                    data={
+                                        'username': 'SomeOne@Gmail.com',
+                                        'password': '34somepassword34'
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_login_with_username_containing_at_sign(self):
+        CustomUser.objects.create_user(username='some@user',
+                                       password='34somepassword34',
+                                       email='other@gmail.com')
+        hasher = type(get_hasher())
+        with mock.patch.object(hasher, 'encode', autospec=True,
+                               side_effect=hasher.encode) as encode:
+            response = self.client.post(reverse('users:login'),
+                                        data={'username': 'some@user',
+                                              'password': '34somepassword34'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.wsgi_request.user.username, 'some@user')
+        self.assertEqual(encode.call_count, 1)
+
+    def test_authenticate_with_email_is_one_query(self):
+        with self.assertNumQueries(1):
+            user = auth.authenticate(username='SomeOne@Gmail.com',
+                                     password='34somepassword34')
+        self.assertEqual(user.username, 'some_user')
+
+
 class LogoutViewTest(TestCase):
 
     def test_correct_response_to_not_logged_user(self):
@@ -214,3 +273,265 @@ class BecomeUserViewTest(TestCase):
         response = self.client.get(reverse('users:become-user'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'users/become_user.html')
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                   USERS_CACHE_TIMEOUT=60 * 15)
+class CachedAuthenticationTest(TestCase):
+    backend = 'users.authentication.EmailAuthBackend'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='some_user',
+                                                  password='34somepassword34',
+                                                  email='someone@gmail.com')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user, backend=self.backend)
+        # Warms the session, user and index page caches
+        self.client.get(reverse('movies:index'))
+
+    def test_logged_in_request_runs_no_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('movies:index'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_password_change_ends_other_sessions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('34otherpassword34')
+            self.user.save()
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_deactivated_user_is_logged_out(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_user_read_before_a_change_is_not_cached(self):
+        backend = EmailAuthBackend()
+        load_user = backend.load_user
+
+        def load_user_then_change_password(user_id):
+            user = load_user(user_id)
+            # The change commits while the old row is in hand
+            with self.captureOnCommitCallbacks(execute=True):
+                changed = CustomUser.objects.get(pk=user_id)
+                changed.set_password('34otherpassword34')
+                changed.save()
+            return user
+
+        forget_user(self.user.pk)
+        with mock.patch.object(EmailAuthBackend, 'load_user',
+                               side_effect=load_user_then_change_password):
+            self.assertEqual(backend.get_user(self.user.pk).password,
+                             self.user.password)
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_user_is_read_from_primary(self):
+        forget_user(self.user.pk)
+        token = routers._replica.set('replica1')
+        try:
+            # replica1 is not configured, reading from it would fail
+            user = EmailAuthBackend().get_user(self.user.pk)
+        finally:
+            routers._replica.reset(token)
+        self.assertEqual(user, self.user)
+
+    def test_bulk_update_ends_sessions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_bulk_password_reset_ends_sessions(self):
+        self.user.set_password('34otherpassword34')
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.bulk_update([self.user], ['password'])
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_evicted_generation_is_not_reused(self):
+        cache.delete(GENERATION_KEY)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies:index'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    @override_settings(USERS_CACHE_TIMEOUT=0)
+    def test_users_are_not_cached_without_timeout(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies:index'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_registered_user_is_logged_in_with_email_backend(self):
+        self.client.logout()
+        self.client.post(reverse('users:register'),
+                         data={'username': 'user12',
+                               'email': 'user12@gmail.com',
+                               'password1': '34password34',
+                               'password2': '34password34'})
+        self.assertEqual(self.client.session[auth.BACKEND_SESSION_KEY],
+                         self.backend)
+
+
+@override_settings(PASSWORD_REHASH_IN_BACKGROUND=False,
+                   PASSWORD_PBKDF2_ITERATIONS=1000)
+class PasswordRehashTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='some_user',
+                                                  email='someone@gmail.com')
+        cls.user.password = make_password('34somepassword34',
+                                          hasher='pbkdf2_sha256')
+        cls.user.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def log_in(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('users:login'),
+                                    data={'username': 'someone@gmail.com',
+                                          'password': '34somepassword34'})
+
+    def test_hash_of_other_hasher_is_replaced_after_login(self):
+        old_password = self.user.password
+        self.log_in()
+        self.user.refresh_from_db()
+        self.assertEqual(identify_hasher(self.user.password).algorithm,
+                         get_hasher().algorithm)
+        # Only the session hash of the old password hash is kept
+        self.assertEqual(self.user.previous_session_hash,
+                         session_hash(old_password))
+        self.assertNotIn(old_password, [getattr(self.user, field.attname)
+                                        for field in CustomUser._meta.fields])
+        self.assertTrue(self.user.check_password('34somepassword34'))
+
+    def test_hash_is_replaced_when_cost_changes(self):
+        with self.settings(PASSWORD_HASHERS=['users.hashers.PBKDF2PasswordHasher']):
+            self.log_in()
+            self.user.refresh_from_db()
+            self.assertEqual(self.user.previous_session_hash, '')
+            with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+                self.log_in()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_session_stays_valid_after_rehash(self):
+        self.log_in()
+        response = self.client.get(reverse('movies:index'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_session_started_before_rehash_ends_when_session_hash_expires(self):
+        self.log_in()
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(username='some_user').update(
+                previous_session_hash_expires=timezone.now())
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+        self.assertEqual(forget_expired_session_hashes(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.previous_session_hash, '')
+        self.assertIsNone(self.user.previous_session_hash_expires)
+
+    def test_password_change_ends_sessions_started_before_rehash(self):
+        self.log_in()
+        with self.captureOnCommitCallbacks(execute=True):
+            user = CustomUser.objects.get(username='some_user')
+            user.set_password('34otherpassword34')
+            user.save()
+        response = self.client.get(reverse('movies:index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+
+@override_settings(USERS_THROTTLE_WINDOW=60,
+                   USERS_THROTTLE_LIMITS={'login': {'ip': 5, 'email': 3},
+                                          'register': {'ip': 2, 'email': 0}})
+class ThrottlingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.create_user(username='some_user',
+                                       password='34somepassword34',
+                                       email='someone@gmail.com')
+
+    def setUp(self):
+        cache.clear()
+
+    def log_in(self, username, password='wrongpassword123', **extra):
+        return self.client.post(reverse('users:login'),
+                                data={'username': username, 'password': password},
+                                **extra)
+
+    def test_login_is_throttled_per_email_in_any_case(self):
+        for username in ('someone@gmail.com', 'SomeOne@Gmail.com', ' SOMEONE@gmail.com'):
+            self.assertEqual(self.log_in(username).status_code, 200)
+        response = self.log_in('someone@gmail.com', '34somepassword34')
+        self.assertEqual(response.status_code, 429)
+        self.assertTemplateUsed(response, 'errors/429.html')
+        self.assertContains(response, 'Too many attempts', status_code=429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 61)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+        # Other emails are still allowed from the same address
+        self.assertEqual(self.log_in('other@gmail.com').status_code, 200)
+
+    def test_login_is_throttled_per_ip(self):
+        for number in range(5):
+            self.assertEqual(self.log_in(f'user{number}@gmail.com').status_code, 200)
+        self.assertEqual(self.log_in('user5@gmail.com').status_code, 429)
+        response = self.log_in('user5@gmail.com', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_throttled_attempt_hashes_no_password(self):
+        for _ in range(3):
+            self.log_in('someone@gmail.com')
+        hasher = type(get_hasher())
+        with mock.patch.object(hasher, 'encode', autospec=True,
+                               side_effect=hasher.encode) as encode:
+            response = self.log_in('someone@gmail.com', '34somepassword34')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(encode.call_count, 0)
+
+    def test_registration_is_throttled_per_ip(self):
+        for number in range(2):
+            response = self.client.post(reverse('users:register'), data={})
+            self.assertEqual(response.status_code, 200)
+        with mock.patch('users.views.UserCreationForm') as form_class:
+            response = self.client.post(reverse('users:register'), data={})
+        self.assertEqual(response.status_code, 429)
+        form_class.assert_not_called()
+
+    def test_sliding_window_counts_part_of_previous_window(self):
+        window = SlidingWindow(cache, 'test:', 4, 60)
+        with mock.patch('cookie.throttling.time.time', return_value=6000):
+            for _ in range(4):
+                self.assertEqual(window.attempt('client'), 0)
+            self.assertEqual(window.attempt('client'), 60)
+        # Half of the previous window, 5 attempts including the
+        # rejected one, is still inside the last 60 seconds
+        with mock.patch('cookie.throttling.time.time', return_value=6090):
+            self.assertEqual(window.attempt('client'), 0)
+            self.assertGreater(window.attempt('client'), 0)
+        with mock.patch('cookie.throttling.time.time', return_value=6120):
+            self.assertEqual(window.attempt('client'), 0)
+
+    def test_long_emails_with_spaces_make_valid_cache_keys(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            for _ in range(4):
+                response = self.log_in('some one' * 40 + '@gmail.com')
+        self.assertEqual(response.status_code, 429)
+
+    def test_counters(self):
+        for _ in range(4):
+            self.log_in('someone@gmail.com')
+        self.assertEqual(throttling.get_counters('login'),
+                         {'attempts': 4, 'throttled': 1})
+        self.assertEqual(throttling.get_counters('register'),
+                         {'attempts': 0, 'throttled': 0})
+        throttling.reset_counters('login')
+        self.assertEqual(throttling.get_counters('login'),
+                         {'attempts': 0, 'throttled': 0})
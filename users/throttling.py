@@ -0,0 +1,54 @@
+"""
+Limits on login and registration attempts per IP address and per email,
+checked before the form is validated, so a rejected attempt hashes no
+password. Counts live in the users cache, shared by all processes.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from cookie.throttling import SlidingWindow, increment
+
+WINDOW_PREFIX = 'users:throttle:'
+STATS_PREFIX = 'users:stats:'
+
+ACTIONS = ('login', 'register')
+
+
+def get_cache():
+    return caches[settings.USERS_CACHE_ALIAS]
+
+
+def count(action, counter):
+    increment(get_cache(), f'{STATS_PREFIX}{action}:{counter}')
+
+
+def get_counters(action):
+    keys = {f'{STATS_PREFIX}{action}:{counter}': counter
+            for counter in ('attempts', 'throttled')}
+    found = get_cache().get_many(keys)
+    return {counter: found.get(key, 0) for key, counter in keys.items()}
+
+
+def reset_counters(action):
+    get_cache().delete_many([f'{STATS_PREFIX}{action}:{counter}'
+                             for counter in ('attempts', 'throttled')])
+
+
+def attempt(action, request, email):
+    """
+    Record a login or registration attempt from the request's IP
+    address for the email, return seconds to wait if it is rejected.
+    """
+    limits = settings.USERS_THROTTLE_LIMITS[action]
+    window = settings.USERS_THROTTLE_WINDOW
+    count(action, 'attempts')
+    clients = [
+        ('ip', request.META.get('REMOTE_ADDR', '')),
+        ('email', (email or '').strip().lower()),
+    ]
+    for kind, client in clients:
+        retry_after = SlidingWindow(get_cache(), f'{WINDOW_PREFIX}{action}:{kind}:',
+                                    limits[kind], window).attempt(client)
+        if retry_after:
+            count(action, 'throttled')
+            return retry_after
+    return 0
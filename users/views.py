@@ -1,12 +1,21 @@
 from django.contrib import messages
-from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.shortcuts import render, redirect
 from django.views import View
+from users import throttling
 from users.forms import UserCreationForm, UserChangeForm, EmailLoginForm
 
 
+def too_many_attempts(request, retry_after):
+    response = render(request, 'errors/429.html',
+                      {'message': 'Too many attempts, please wait a bit'},
+                      status=429)
+    response['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+
 class RegisterUserView(View):
     form_class = UserCreationForm
     template_name = 'users/register.html'
@@ -16,10 +25,14 @@ class RegisterUserView(View):
         return render(request, self.template_name, {'form': form})
 
     def post(self, request):
+        retry_after = throttling.attempt('register', request,
+                                         request.POST.get('email'))
+        if retry_after:
+            return too_many_attempts(request, retry_after)
         form = self.form_class(request.POST, request.FILES)
         if form.is_valid():
             user = form.save()
-            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+            login(request, user, backend='users.authentication.EmailAuthBackend')
             messages.success(request, 'You were successfully registered.')
             return redirect('movies:index')
         return render(request, self.template_name, {'form': form})
@@ -54,15 +67,16 @@ class LoginUserView(View):
         return render(request, self.template_name, {'form': form})
 
     def post(self, request, *args, **kwargs):
+        retry_after = throttling.attempt('login', request,
+                                         request.POST.get('username'))
+        if retry_after:
+            return too_many_attempts(request, retry_after)
         form = self.form_class(request, request.POST)
         if form.is_valid():
-            email = form.cleaned_data['email']
-            password = form.cleaned_data['password']
-            user = authenticate(username=email, password=password)
-            if user:
-                login(request, user)
-                messages.success(request, 'Welcome back.')
-                return redirect('movies:index')
+            # The form has already authenticated the user
+            login(request, form.get_user())
+            messages.success(request, 'Welcome back.')
+            return redirect('movies:index')
         return render(request, self.template_name, {'form': form})
 
 